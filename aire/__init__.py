@@ -0,0 +1 @@
+"""Shared data access and processing for the air quality dashboard."""
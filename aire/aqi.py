@@ -0,0 +1,250 @@
+"""Air quality categories and indexes for PM2.5.
+
+Breakpoint tables drive every place the dashboard labels or colors a value.
+NOM_172 is the Mexican NOM-172-SEMARNAT-2019 scale the dashboard has always
+used; EPA is the US AQI (2024 revision), which also maps concentrations to a
+0-500 index. Everything works on whole arrays at once, so it is as cheap on
+millions of raw readings as on the ~100 sensor averages.
+
+Rolling concentrations come from the hourly store:
+
+    actual = aqi.latest(snapshot.hourly)
+
+gives each sensor's latest 1 h mean, 12 h NowCast and 24 h mean, plus the
+index and category of the table picked with AQI_STANDARD.
+"""
+import os
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+#----------
+# Breakpoint tables
+
+# Missing values get code -1 and this category.
+MISSING = ("Sin datos", "⚪", "rgba(150,150,150,0.9)")
+
+
+@dataclass(frozen=True)
+class Breakpoints:
+    """A category scale for one pollutant.
+
+    categories holds (label, emoji, color, upper concentration, upper index)
+    per category. Upper bounds are inclusive and the ranges continuous: with
+    NOM_172, 25 is Buena and 25.5 Aceptable. upper index is None for scales
+    without a numeric index.
+    """
+    name: str
+    categories: tuple
+    # Concentration the scale applies to: '1h', 'nowcast' or '24h'.
+    window: str = 'nowcast'
+    # Concentrations are truncated to this many decimals first, as EPA does.
+    decimals: int = None
+
+    @property
+    def labels(self):
+        return np.array([category[0] for category in self.categories] + [MISSING[0]], dtype=object)
+
+    @property
+    def emoji_labels(self):
+        return np.array([f"{category[1]} {category[0]}" for category in self.categories + (MISSING,)], dtype=object)
+
+    @property
+    def colors(self):
+        return np.array([category[2] for category in self.categories] + [MISSING[2]], dtype=object)
+
+    @property
+    def color_map(self):
+        return dict(zip(self.labels, self.colors))
+
+    @property
+    def edges(self):
+        # The last category is open ended.
+        return np.array([category[3] for category in self.categories[:-1]], dtype=float)
+
+    @property
+    def has_index(self):
+        return self.categories[0][4] is not None
+
+    def _truncate(self, values):
+        values = np.asarray(values, dtype=float)
+        if self.decimals is None:
+            return values
+        scale = 10 ** self.decimals
+        # The epsilon keeps 9.1 * 10 from flooring to 90.
+        return np.floor(values * scale + 1e-9) / scale
+
+    def codes(self, values):
+        """Category index of each value, -1 where it is missing."""
+        values = self._truncate(values)
+        # side='left' puts a value equal to an edge in the lower category.
+        codes = np.searchsorted(self.edges, values, side='left')
+        return np.where(np.isnan(values), -1, codes)
+
+    def index(self, values):
+        """Index value of each concentration, interpolated within its category."""
+        values = self._truncate(values)
+        if not self.has_index:
+            return np.full(values.shape, np.nan)
+        step = 10.0 ** -(self.decimals or 0)
+        c_high = np.array([category[3] for category in self.categories], dtype=float)
+        c_low = np.concatenate([[0.0], c_high[:-1] + step])
+        i_high = np.array([category[4] for category in self.categories], dtype=float)
+        i_low = np.concatenate([[0.0], i_high[:-1] + 1])
+        codes = np.searchsorted(self.edges, np.nan_to_num(values), side='left')
+        index = (i_high - i_low)[codes] / (c_high - c_low)[codes] * (values - c_low[codes]) + i_low[codes]
+        return np.clip(np.round(index), 0, i_high[-1])
+
+
+NOM_172 = Breakpoints(
+    name='NOM-172',
+    categories=(
+        ("Buena", "🟢", "rgba(0,205,0,0.9)", 25, None),
+        ("Aceptable", "🟡", "rgba(255,215,0,0.9)", 45, None),
+        ("Mala", "🟠", "rgba(250,135,0,0.9)", 79, None),
+        ("Muy Mala", "🔴", "rgba(235,0,0,0.9)", 147, None),
+        ("Extremadamente Mala", "🟣", "rgba(188,23,255,0.9)", np.inf, None),
+    ),
+)
+
+EPA = Breakpoints(
+    name='EPA',
+    categories=(
+        ("Buena", "🟢", "rgba(0,228,0,0.9)", 9.0, 50),
+        ("Moderada", "🟡", "rgba(255,255,0,0.9)", 35.4, 100),
+        ("Dañina para grupos sensibles", "🟠", "rgba(255,126,0,0.9)", 55.4, 150),
+        ("Dañina", "🔴", "rgba(255,0,0,0.9)", 125.4, 200),
+        ("Muy dañina", "🟣", "rgba(143,63,151,0.9)", 225.4, 300),
+        ("Peligrosa", "🟤", "rgba(126,0,35,0.9)", 325.4, 500),
+    ),
+    decimals=1,
+)
+
+TABLES = {table.name: table for table in (NOM_172, EPA)}
+
+# Scale used for the current index: 'NOM-172' or 'EPA'.
+AQI_STANDARD = os.environ.get('AQI_STANDARD', NOM_172.name)
+
+# Color per label of the page's own scale, for building one trace per category.
+color_map = NOM_172.color_map
+
+#----------
+# Classification
+
+def classify(values, table=NOM_172):
+    """Codes, labels, emoji labels and colors for a series of concentrations.
+
+    Returns a frame aligned with values; labels are categoricals so even
+    millions of rows stay small.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    codes = table.codes(values)
+    # -1 maps to the last category, MISSING.
+    lookup = np.where(codes < 0, len(table.categories), codes)
+    return pd.DataFrame({
+        'code': codes,
+        'calidad_aire': pd.Categorical.from_codes(lookup, categories=table.labels),
+        'color_label': pd.Categorical.from_codes(lookup, categories=table.emoji_labels),
+        'color': pd.Categorical.from_codes(lookup, categories=table.colors),
+    }, index=index)
+
+#----------
+# Rolling concentrations
+
+# Hours in the NowCast window.
+NOWCAST_HOURS = 12
+
+# Rows of the (hour, sensor) matrix processed at once by nowcast().
+CHUNK_HOURS = 2048
+
+
+def rolling_mean(sums, counts, hours):
+    """Mean of the readings in the trailing window of each (hour, sensor) cell."""
+    zeros = np.zeros((1, sums.shape[1]))
+    total_sums = np.cumsum(np.vstack([zeros, sums]), axis=0)
+    total_counts = np.cumsum(np.vstack([zeros, counts]), axis=0)
+    end = np.arange(1, len(sums) + 1)
+    start = np.maximum(end - hours, 0)
+    window_sums = total_sums[end] - total_sums[start]
+    window_counts = total_counts[end] - total_counts[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+
+def nowcast(means, hours=NOWCAST_HOURS, min_weight=0.5):
+    """NowCast of hourly means shaped (hour, sensor), oldest hour first.
+
+    Each hour weighs w times the one after it, where w is the window's
+    min/max ratio but at least min_weight, so steady air averages over the
+    whole window and changing air follows the newest hours. Cells need two
+    of the three most recent hours to be valid.
+    """
+    padded = np.vstack([np.full((hours - 1, means.shape[1]), np.nan), means])
+    result = np.full(means.shape, np.nan)
+    for start in range(0, len(means), CHUNK_HOURS):
+        stop = min(start + CHUNK_HOURS, len(means))
+        # (hour, sensor, lag), newest hour at lag 0.
+        windows = np.stack([
+            padded[start + hours - 1 - lag:stop + hours - 1 - lag] for lag in range(hours)
+        ], axis=-1)
+        present = ~np.isnan(windows)
+        with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+            # All-empty windows warn; they're masked out below.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            low = np.nanmin(windows, axis=-1)
+            high = np.nanmax(windows, axis=-1)
+            weight = np.clip(np.where(high > 0, low / high, 1.0), min_weight, 1.0)
+            weights = np.where(present, np.nan_to_num(weight)[..., None] ** np.arange(hours), 0.0)
+            value = (weights * np.where(present, windows, 0.0)).sum(axis=-1) / weights.sum(axis=-1)
+        recent = present[..., :3].sum(axis=-1) >= 2
+        result[start:stop] = np.where(recent, value, np.nan)
+    return result
+
+
+def concentrations(hourly, desde=None, hasta=None):
+    """1 h, NowCast and 24 h PM2.5 for every sensor and hour in [desde, hasta).
+
+    Returns the hours, the sensor ids and a dict of (hour, sensor) arrays.
+    Hours before desde aren't loaded, so the first 23 rows only see part of
+    their window.
+    """
+    hours, sensor_ids, sums, counts = hourly.matrix('pm25', desde, hasta)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return hours, sensor_ids, {
+        '1h': means,
+        'nowcast': nowcast(means),
+        '24h': rolling_mean(sums, counts, 24),
+    }
+
+
+def history(hourly, desde=None, hasta=None, table=None):
+    """Rolling concentrations, index and category per sensor and hour, long form."""
+    table = table or TABLES[AQI_STANDARD]
+    hours, sensor_ids, values = concentrations(hourly, desde, hasta)
+    frame = pd.DataFrame({
+        'bucket': np.repeat(hours.to_numpy(), len(sensor_ids)),
+        'sensor_id': np.tile(np.asarray(sensor_ids), len(hours)),
+        **{f'pm25_{window}': values[window].ravel() for window in values},
+    })
+    frame['indice'] = table.index(frame[f'pm25_{table.window}'])
+    frame['categoria'] = table.codes(frame[f'pm25_{table.window}'])
+    return frame
+
+
+def latest(hourly, hasta=None, table=None):
+    """Each sensor's rolling concentrations, index and category at the last hour before hasta."""
+    table = table or TABLES[AQI_STANDARD]
+    if not len(hourly):
+        return pd.DataFrame(columns=['sensor_id', 'pm25_1h', 'pm25_nowcast', 'pm25_24h', 'indice', 'calidad_actual'])
+    end = pd.Timestamp(hasta) if hasta is not None else pd.Timestamp(hourly.buckets[-1]) + pd.Timedelta(hours=1)
+    hours, sensor_ids, values = concentrations(hourly, end - pd.Timedelta(hours=24), end)
+    frame = pd.DataFrame({'sensor_id': np.asarray(sensor_ids)})
+    for window, matrix in values.items():
+        frame[f'pm25_{window}'] = (matrix[-1] if len(matrix) else np.nan)
+        frame[f'pm25_{window}'] = frame[f'pm25_{window}'].round(1)
+    frame['indice'] = table.index(frame[f'pm25_{table.window}'])
+    frame['calidad_actual'] = classify(frame[f'pm25_{table.window}'], table)['color_label'].astype(str)
+    return frame
@@ -0,0 +1,513 @@
+import os
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from aire import db, sensores
+
+# Readings are stored in UTC (air_quality.ts); the dashboard shows Monterrey time.
+LOCAL_TZ = 'America/Monterrey'
+local_tz = pytz.timezone(LOCAL_TZ)
+
+# First day with reliable readings.
+START_DATE = date(2023, 5, 8)
+
+#----------
+# Queries
+
+# Every reading since the sensors went live, used for the download. Only rows
+# newer than since_id are returned, so refreshes fetch just the delta through
+# the primary key. Sensor names live in the sensor registry (aire.sensores)
+# and are joined only when needed.
+READINGS_QUERY = """
+SELECT
+    a.pollution_id,
+    a.ts AT TIME ZONE 'America/Monterrey' as fecha,
+    a.sensor_id,
+    a.pm25,
+    a.humidity,
+    a.temp_celsius
+FROM air_quality a
+WHERE a.pollution_id > %(since_id)s AND a.ts >= %(desde)s
+ORDER BY a.ts;
+"""
+
+# dtypes of the readings kept in memory: local naive timestamps, 32-bit ids
+# (air_quality's own column types) and float32 measurements, which hold the
+# sensors' precision.
+READING_DTYPES = {
+    'pollution_id': 'int32',
+    'fecha': 'datetime64[ns]',
+    'sensor_id': 'int32',
+    'pm25': 'float32',
+    'humidity': 'float32',
+    'temp_celsius': 'float32',
+}
+
+# Columns offered in the download.
+EXPORT_COLUMNS = ['pollution_id', 'fecha', 'sensor', 'municipio', 'sensor_id', 'pm25', 'humidity']
+
+# Readings for a filtered download, streamed through a server-side cursor.
+# The predicates are range scans on the (sensor_id, ts) and (ts) indexes
+# created by aire.migrate_timestamps.
+FILTERED_READINGS_QUERY = """
+SELECT
+    a.pollution_id,
+    a.ts AT TIME ZONE 'America/Monterrey' as fecha,
+    s.nombre as sensor,
+    s.municipio,
+    a.sensor_id,
+    a.pm25,
+    a.humidity
+FROM air_quality a
+JOIN sensors s ON a.sensor_id = s.sensor_id
+WHERE {predicates}
+ORDER BY a.ts;
+"""
+
+# Running totals per sensor, used to compute the averages shown by the table,
+# scatter plot and map. Keeping sums and counts instead of averages lets new
+# readings be folded in without touching the history again.
+#
+# Totals come from the daily rollups (see aire.rollups) plus any readings the
+# rollups haven't merged yet, so the result is exact even when they lag.
+# Windows are summed in memory (see SnapshotManager.window_summary),
+# so only the full history is read here. Missing temperatures count as 0, as
+# the dashboard always has.
+TOTALS_QUERY = """
+WITH parciales AS (
+    SELECT
+        r.sensor_id,
+        r.pm25_sum,
+        r.pm25_count,
+        r.temp_celsius_sum,
+        r.n as temp_celsius_count,
+        r.humidity_sum,
+        r.humidity_count
+    FROM air_quality_daily r
+    WHERE r.bucket >= %(desde)s
+    UNION ALL
+    SELECT
+        a.sensor_id,
+        COALESCE(a.pm25, 0),
+        (a.pm25 IS NOT NULL)::int,
+        COALESCE(a.temp_celsius, 0),
+        1,
+        COALESCE(a.humidity, 0),
+        (a.humidity IS NOT NULL)::int
+    FROM air_quality a
+    WHERE a.pollution_id > (SELECT last_pollution_id FROM rollup_state WHERE name = 'air_quality')
+      AND a.ts >= %(desde_ts)s
+)
+SELECT
+    p.sensor_id,
+    s.nombre,
+    s.municipio,
+    SUM(p.pm25_sum) as sum_pm25,
+    SUM(p.pm25_count) as n_pm25,
+    SUM(p.temp_celsius_sum) as sum_temp_celsius,
+    SUM(p.temp_celsius_count) as n_temp_celsius,
+    SUM(p.humidity_sum) as sum_humidity,
+    SUM(p.humidity_count) as n_humidity
+FROM parciales p
+JOIN sensors s ON p.sensor_id = s.sensor_id
+GROUP BY p.sensor_id, s.nombre, s.municipio;
+"""
+
+# Default window for the averages: '24h', '7d', '30d' (any number of hours or
+# days back) or a start date, 'YYYY-MM-DD'.
+SUMMARY_WINDOW = os.environ.get('SUMMARY_WINDOW', START_DATE.isoformat())
+
+# Measurements averaged per sensor.
+MEASUREMENTS = ['pm25', 'temp_celsius', 'humidity']
+
+#----------
+# Filters
+
+def local_start(day):
+    """The instant a local calendar day starts, for comparing against ts."""
+    return local_tz.localize(datetime.combine(day, time()))
+
+
+def readings_predicates(municipio=None, sensor_ids=(), desde=None, hasta=None):
+    """Build the WHERE clause and parameters for FILTERED_READINGS_QUERY.
+
+    desde and hasta are inclusive local dates.
+    """
+    desde = max(desde or START_DATE, START_DATE)
+    predicates = ["a.ts >= %(desde)s"]
+    params = {'desde': local_start(desde)}
+    if hasta is not None:
+        predicates.append("a.ts < %(hasta)s")
+        params['hasta'] = local_start(hasta + timedelta(days=1))
+    if sensor_ids:
+        predicates.append("a.sensor_id = ANY(%(sensor_ids)s)")
+        params['sensor_ids'] = list(sensor_ids)
+    if municipio:
+        predicates.append("s.municipio = %(municipio)s")
+        params['municipio'] = municipio
+    return " AND ".join(predicates), params
+
+#----------
+# Windows
+
+def local_now():
+    return datetime.now(local_tz).replace(tzinfo=None)
+
+
+def parse_window(spec, now=None):
+    """Turn a SUMMARY_WINDOW spec into local (start, end) bounds.
+
+    Relative windows are aligned to the hour so they map onto the hourly
+    rollups and stay stable long enough to be cached. end is None for
+    windows that run up to the latest reading.
+    """
+    now = now or local_now()
+    spec = spec.strip().lower()
+    if spec[-1:] in ('h', 'd') and spec[:-1].isdigit():
+        amount = int(spec[:-1])
+        delta = timedelta(hours=amount) if spec.endswith('h') else timedelta(days=amount)
+        return (now - delta).replace(minute=0, second=0, microsecond=0), None
+    return datetime.combine(date.fromisoformat(spec), time()), None
+
+
+#----------
+# Readings
+
+def _empty_readings():
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in READING_DTYPES.items()})
+
+
+class ReadingsLog:
+    """Append-only readings history stored as immutable segments.
+
+    Appending merges trailing segments only while the newest one is at least
+    as large as the one before it, so each row is copied a logarithmic number
+    of times over the life of the process instead of on every refresh.
+
+    Readings of sensors missing from the registry are held aside rather than
+    dropped, since last_id moves past them; they join the segments once
+    their sensor is registered.
+    """
+
+    def __init__(self, segments=(), last_id=0, held=None):
+        self.segments = tuple(segment for segment in segments if not segment.empty)
+        self.last_id = last_id
+        self.held = held if held is not None else _empty_readings()
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def append(self, loaded, sensor_ids):
+        """Fold in newly loaded readings, given the registered sensor_ids.
+
+        Returns the new log and the readings that joined its segments: those
+        of registered sensors among loaded and among the ones held before.
+        """
+        last_id = max(self.last_id, int(loaded['pollution_id'].max())) if not loaded.empty else self.last_id
+        pending = pd.concat([self.held, loaded], ignore_index=True) if not self.held.empty else loaded
+        registered = pending['sensor_id'].isin(sensor_ids).to_numpy()
+        delta = pending[registered].reset_index(drop=True)
+        held = pending[~registered].reset_index(drop=True)
+        if delta.empty:
+            return ReadingsLog(self.segments, last_id, held), delta
+        segments = list(self.segments) + [delta]
+        while len(segments) > 1 and len(segments[-2]) <= len(segments[-1]):
+            tail = segments.pop()
+            segments[-1] = pd.concat([segments[-1], tail], ignore_index=True)
+        return ReadingsLog(segments, last_id, held), delta
+
+    def window(self, desde=None, hasta=None, sensor_ids=None):
+        """Readings in [desde, hasta), local times, optionally for some sensors only."""
+        parts = []
+        for segment in self.segments:
+            mask = np.ones(len(segment), dtype=bool)
+            if desde is not None:
+                mask &= (segment['fecha'] >= desde).to_numpy()
+            if hasta is not None:
+                mask &= (segment['fecha'] < hasta).to_numpy()
+            if sensor_ids is not None:
+                mask &= segment['sensor_id'].isin(sensor_ids).to_numpy()
+            # Segments are immutable, so a whole one is shared, not copied.
+            parts.append(segment if mask.all() else segment[mask])
+        if not parts:
+            return self.to_frame()
+        if len(parts) == 1:
+            return parts[0]
+        return pd.concat(parts, ignore_index=True)
+
+    def to_frame(self):
+        if not self.segments:
+            return _empty_readings()
+        if len(self.segments) == 1:
+            return self.segments[0]
+        return pd.concat(self.segments, ignore_index=True)
+
+#----------
+# Hourly store
+
+# Totals kept per sensor and hour.
+TOTAL_COLUMNS = [f'{prefix}_{column}' for prefix in ('sum', 'n') for column in MEASUREMENTS]
+
+
+def hourly_totals(readings):
+    """Aggregate readings into per-sensor totals for each local hour."""
+    readings = readings.assign(bucket=readings['fecha'].dt.floor('H'), temp_celsius=readings['temp_celsius'].fillna(0))
+    return readings.groupby(['bucket', 'sensor_id'], as_index=False).agg(
+        **{f'sum_{column}': (column, 'sum') for column in MEASUREMENTS},
+        **{f'n_{column}': (column, 'count') for column in MEASUREMENTS},
+    )
+
+
+class HourlyStore:
+    """Per-sensor hourly totals indexed by time, for filtering on the page.
+
+    Rows are kept in bucket order, so any window is a contiguous slice found
+    with a binary search, and the per-sensor totals within it are a bincount
+    over dense sensor codes. Like ReadingsLog, appending returns a new store.
+
+    The arrays are views of larger buffers that grow geometrically. Appending
+    writes the new rows past the end of the view, where no existing store
+    looks, so a refresh copies the history only when the buffers are full
+    (or when late readings have to be sorted in). The buffers remember how
+    far they are filled; a store that isn't the newest to use them copies
+    instead, so appending twice to the same store is still safe.
+    """
+
+    def __init__(self, buckets=None, codes=None, values=None, sensor_ids=None, sensors=None, buffers=None):
+        self.buckets = buckets if buckets is not None else np.array([], dtype='datetime64[ns]')
+        self.codes = codes if codes is not None else np.array([], dtype=np.int64)
+        self.values = values if values is not None else np.empty((0, len(TOTAL_COLUMNS)))
+        self.sensor_ids = sensor_ids if sensor_ids is not None else pd.Index([], dtype=np.int64)
+        # nombre and municipio, aligned with sensor_ids.
+        self.sensors = sensors if sensors is not None else pd.DataFrame(columns=['nombre', 'municipio'])
+        # (buckets, codes, values, [rows filled]) the arrays above are views of.
+        self._buffers = buffers
+
+    def __len__(self):
+        return len(self.buckets)
+
+    @property
+    def nbytes(self):
+        arrays = self._buffers[:3] if self._buffers is not None else (self.buckets, self.codes, self.values)
+        return int(sum(array.nbytes for array in arrays))
+
+    def _room(self, added, copy):
+        """Buffers with space for added more rows, holding this store's rows first."""
+        size = len(self)
+        buffers = self._buffers
+        if not copy and buffers is not None and buffers[3][0] == size and len(buffers[0]) >= size + added:
+            return buffers
+        capacity = max(2 * (size + added), 1024)
+        buffers = (
+            np.empty(capacity, dtype=self.buckets.dtype),
+            np.empty(capacity, dtype=np.int64),
+            np.empty((capacity, len(TOTAL_COLUMNS))),
+            [size],
+        )
+        buffers[0][:size], buffers[1][:size], buffers[2][:size] = self.buckets, self.codes, self.values
+        return buffers
+
+    def append(self, readings, sensors):
+        """Fold new readings in; sensors maps sensor_id to nombre and municipio."""
+        if readings.empty:
+            return self.relabel(sensors)
+        hourly = hourly_totals(readings)
+        sensor_ids = self.sensor_ids.append(
+            pd.Index(hourly['sensor_id'].unique()).difference(self.sensor_ids)
+        )
+        # hourly_totals sorts by bucket, so the first row is the earliest.
+        late = len(self) and hourly['bucket'].iloc[0] < self.buckets[-1]
+        # Late readings are sorted in place, which only a private copy allows.
+        buffers = self._room(len(hourly), copy=late)
+        start, stop = len(self), len(self) + len(hourly)
+        buffers[0][start:stop] = hourly['bucket'].to_numpy()
+        buffers[1][start:stop] = sensor_ids.get_indexer(hourly['sensor_id'])
+        buffers[2][start:stop] = hourly[TOTAL_COLUMNS].to_numpy(dtype=float)
+        buffers[3][0] = stop
+        buckets, codes, values = buffers[0][:stop], buffers[1][:stop], buffers[2][:stop]
+        if late:
+            # A stable sort keeps the rest in place.
+            order = np.argsort(buckets, kind='stable')
+            buckets[:], codes[:], values[:] = buckets[order], codes[order], values[order]
+        return HourlyStore(buckets, codes, values, sensor_ids, buffers=buffers).relabel(sensors)
+
+    def relabel(self, sensors):
+        """The same totals under new names; sensors maps sensor_id to nombre and municipio."""
+        names = sensors.set_index('sensor_id')[['nombre', 'municipio']].reindex(self.sensor_ids)
+        return HourlyStore(self.buckets, self.codes, self.values, self.sensor_ids, names, self._buffers)
+
+    def _slice(self, desde, hasta):
+        start = 0 if desde is None else np.searchsorted(self.buckets, np.datetime64(desde), 'left')
+        stop = len(self.buckets) if hasta is None else np.searchsorted(self.buckets, np.datetime64(hasta), 'left')
+        return start, stop
+
+    def totals(self, desde=None, hasta=None, municipio=None):
+        """Per-sensor totals for [desde, hasta), local times, like load_totals."""
+        start, stop = self._slice(desde, hasta)
+        codes = self.codes[start:stop]
+        size = len(self.sensor_ids)
+        sums = np.column_stack([
+            np.bincount(codes, weights=self.values[start:stop, i], minlength=size)
+            for i in range(len(TOTAL_COLUMNS))
+        ]) if size else np.empty((0, len(TOTAL_COLUMNS)))
+        present = np.bincount(codes, minlength=size) > 0
+        if municipio:
+            present &= (self.sensors['municipio'] == municipio).to_numpy()
+        totals = pd.DataFrame(sums[present], columns=TOTAL_COLUMNS)
+        totals.insert(0, 'sensor_id', self.sensor_ids[present])
+        totals.insert(1, 'nombre', self.sensors['nombre'].to_numpy()[present])
+        totals.insert(2, 'municipio', self.sensors['municipio'].to_numpy()[present])
+        return totals
+
+    def matrix(self, measurement, desde=None, hasta=None):
+        """Hourly sums and counts of one measurement as dense (hour, sensor) arrays.
+
+        Returns the hours, the sensor ids and the two arrays. Hours without
+        readings are rows of zeros; bounds default to the stored range.
+        """
+        if not len(self) and (desde is None or hasta is None):
+            empty = np.zeros((0, len(self.sensor_ids)))
+            return pd.DatetimeIndex([]), self.sensor_ids, empty, empty
+        start, stop = self._slice(desde, hasta)
+        first = pd.Timestamp(desde).floor('H') if desde is not None else pd.Timestamp(self.buckets[0])
+        last = (pd.Timestamp(hasta) - pd.Timedelta(hours=1)).ceil('H') if hasta is not None else pd.Timestamp(self.buckets[-1])
+        hours = pd.date_range(first, last, freq='H')
+        shape = (len(hours), len(self.sensor_ids))
+        rows = (self.buckets[start:stop] - first.to_datetime64()) // np.timedelta64(1, 'h')
+        cells = rows * shape[1] + self.codes[start:stop]
+        arrays = [
+            np.bincount(cells, weights=self.values[start:stop, TOTAL_COLUMNS.index(f'{prefix}_{measurement}')],
+                        minlength=shape[0] * shape[1]).reshape(shape)
+            for prefix in ('sum', 'n')
+        ]
+        return hours, self.sensor_ids, arrays[0], arrays[1]
+
+#----------
+# Totals
+
+def add_delta(totals, delta, sensors):
+    """Fold new readings into the per-sensor totals."""
+    delta = delta.assign(temp_celsius=delta['temp_celsius'].fillna(0))
+    grouped = delta.groupby('sensor_id', as_index=False).agg(
+        **{f'sum_{column}': (column, 'sum') for column in MEASUREMENTS},
+        **{f'n_{column}': (column, 'count') for column in MEASUREMENTS},
+    )
+    grouped = grouped.join(sensors[['nombre', 'municipio']].astype(object), on='sensor_id')
+    combined = pd.concat([totals, grouped[totals.columns]], ignore_index=True)
+    aggregations = {'nombre': 'first', 'municipio': 'first'}
+    aggregations.update({column: 'sum' for column in totals.columns if column.startswith(('sum_', 'n_'))})
+    return combined.groupby('sensor_id', as_index=False, sort=False).agg(aggregations)
+
+
+def relabel(totals, sensors):
+    """Take nombre and municipio from the registry; sensors no longer in it keep theirs."""
+    names = sensors[['nombre', 'municipio']].astype(object).reindex(totals['sensor_id'].to_numpy())
+    return totals.assign(**{
+        column: names[column].fillna(pd.Series(totals[column].to_numpy(), index=names.index)).to_numpy()
+        for column in ('nombre', 'municipio')
+    })
+
+
+def summarize(totals):
+    """Turn per-sensor totals into the rounded averages shown on the page."""
+    summary = totals[['sensor_id', 'nombre', 'municipio']].copy()
+    for column in MEASUREMENTS:
+        summary[f'avg_{column}'] = (totals[f'sum_{column}'].astype(float) / totals[f'n_{column}']).round()
+    summary.sort_values(by='avg_pm25', ascending=False, inplace=True)
+    return summary
+
+#----------
+# Loaders
+
+def compact(readings):
+    """Cast freshly loaded readings to READING_DTYPES."""
+    return readings[list(READING_DTYPES)].astype(READING_DTYPES)
+
+
+def with_sensors(readings, sensors):
+    """Join sensor names onto readings, as the download columns expect."""
+    return readings.join(sensors[['nombre', 'municipio']].rename(columns={'nombre': 'sensor'}), on='sensor_id')
+
+
+def load_sensors(conn):
+    """Sensor metadata indexed by sensor_id, from the sensor registry."""
+    return sensores.registry.get(conn)
+
+
+def load_readings(conn, since_id=0):
+    params = {'since_id': since_id, 'desde': local_start(START_DATE)}
+    return compact(db.read_frame(conn, READINGS_QUERY, params))
+
+
+def load_totals(conn):
+    """Per-sensor totals for every reading since START_DATE."""
+    params = {'desde': datetime.combine(START_DATE, time()), 'desde_ts': local_start(START_DATE)}
+    return db.read_frame(conn, TOTALS_QUERY, params)
+
+
+def load_frames(previous=None):
+    """Load the frames for a new snapshot, as keyword arguments for Snapshot.
+
+    The first load reads the full history. Later loads fetch only readings
+    with a pollution_id above the previous snapshot's newest one and fold
+    them into its readings and totals. Readings are written by a single
+    ingestion process, so ids are committed in order and none are skipped.
+    Only readings of registered sensors are shown; the others are held in
+    the log until their sensor is registered (see ReadingsLog).
+    """
+    with db.connection() as conn:
+        if previous is None:
+            # Every query must see the same rows for the delta to line up.
+            db.begin_snapshot(conn)
+            sensors = load_sensors(conn)
+            readings, delta = ReadingsLog().append(load_readings(conn), sensors.index)
+            totals = load_totals(conn)
+            hourly = HourlyStore()
+        else:
+            sensors = load_sensors(conn)
+            loaded = load_readings(conn, since_id=previous.readings.last_id)
+            readings, delta = previous.readings.append(loaded, sensors.index)
+            if delta.empty and sensors.equals(previous.sensors):
+                return dict(readings=readings, totals=previous.totals, summary=previous.summary,
+                            hourly=previous.hourly, sensors=sensors)
+            # A renamed sensor shows its new name without any new reading.
+            totals = relabel(add_delta(previous.totals, delta, sensors), sensors)
+            hourly = previous.hourly
+    return dict(readings=readings, totals=totals, summary=summarize(totals),
+                hourly=hourly.append(delta, totals), sensors=sensors)
+
+#----------
+# Memory
+
+def memory_report(readings, sensors, hourly, sample_rows=10000):
+    """Bytes this worker holds for the snapshot.
+
+    wide_bytes estimates the readings in the old layout (text dates, a copy
+    of the sensor and municipio names per row, 64-bit numbers), extrapolated
+    from a sample of the newest rows.
+    """
+    rows = len(readings)
+    readings_bytes = int(sum(segment.memory_usage(index=True).sum() for segment in readings.segments))
+    report = {
+        'rows': rows,
+        # Readings of sensors not in the registry yet.
+        'held_rows': len(readings.held),
+        'readings_bytes': readings_bytes,
+        'sensors_bytes': int(sensors.memory_usage(deep=True).sum()),
+        'hourly_bytes': hourly.nbytes,
+    }
+    if rows:
+        sample = with_sensors(readings.segments[-1].tail(sample_rows), sensors)
+        wide = sample.astype({'sensor': object, 'municipio': object, 'pollution_id': 'int64', 'sensor_id': 'int64',
+                              **{column: 'float64' for column in MEASUREMENTS}})
+        wide['fecha'] = wide['fecha'].dt.strftime('%Y/%m/%d %H:%M')
+        wide_bytes = int(wide.memory_usage(index=False, deep=True).sum() / len(sample) * rows)
+        report.update({
+            'wide_bytes': wide_bytes,
+            'saved_bytes': wide_bytes - readings_bytes,
+            'ratio': round(wide_bytes / max(readings_bytes, 1), 1),
+        })
+    return report
@@ -0,0 +1,216 @@
+"""Shared database access for the dashboard.
+
+Every callback and loader in a worker borrows connections from one bounded
+pool instead of connecting per query:
+
+    with db.connection() as conn:
+        frame = db.read_frame(conn, QUERY, params)
+
+A connection is committed when the block exits normally and rolled back on
+error. Connections idle for a while are pinged before being handed out, and
+each one remembers which statements it has already prepared, so repeated
+queries skip parsing and planning.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+from psycopg2 import extensions, pool
+
+log = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Connections per worker.
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', 5))
+
+# How long a request waits for a free connection before failing.
+POOL_WAIT_SECONDS = float(os.environ.get('DB_POOL_WAIT_SECONDS', 10))
+
+# Default per-statement timeout.
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+# Connections idle longer than this are pinged before reuse.
+HEALTH_CHECK_SECONDS = float(os.environ.get('DB_HEALTH_CHECK_SECONDS', 30))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect():
+    """A dedicated connection, for command line tools that don't need the pool."""
+    return psycopg2.connect(DATABASE_URL, connection_factory=PooledConnection)
+
+#----------
+# Connections
+
+class PooledConnection(extensions.connection):
+    """A connection that tracks its prepared statements and settings."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.statement_timeout = None
+        self.last_used = time.monotonic()
+
+
+class Database:
+
+    def __init__(self, dsn, minconn=POOL_MIN, maxconn=POOL_MAX):
+        self._dsn = dsn
+        self._minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Connections borrowed right now; changed under _lock, since request
+        # threads borrow and return them concurrently.
+        self.in_use = 0
+
+    def _get_pool(self):
+        # Created lazily, and again after a fork, so gunicorn workers never
+        # share sockets inherited from the master.
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = pool.ThreadedConnectionPool(
+                        self._minconn, self.maxconn, self._dsn,
+                        connection_factory=PooledConnection,
+                    )
+                    self._pid = os.getpid()
+                    self._slots = threading.BoundedSemaphore(self.maxconn)
+                    self.in_use = 0
+        return self._pool
+
+    def _checkout(self):
+        connections = self._get_pool()
+        conn = connections.getconn()
+        if time.monotonic() - conn.last_used > HEALTH_CHECK_SECONDS:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                log.warning("Discarding broken pooled connection")
+                connections.putconn(conn, close=True)
+                conn = connections.getconn()
+        return conn
+
+    @contextmanager
+    def connection(self, timeout_ms=STATEMENT_TIMEOUT_MS):
+        """Borrow a connection; statements on it time out after timeout_ms."""
+        slots = self._slots
+        if not slots.acquire(timeout=POOL_WAIT_SECONDS):
+            raise PoolTimeout(f"No database connection free after {POOL_WAIT_SECONDS}s")
+        with self._lock:
+            self.in_use += 1
+        conn = None
+        try:
+            conn = self._checkout()
+            if conn.statement_timeout != timeout_ms:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = %s", (timeout_ms,))
+                conn.commit()
+                conn.statement_timeout = timeout_ms
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except BaseException:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+                self._forget_prepared(conn)
+            raise
+        finally:
+            if conn is not None:
+                conn.last_used = time.monotonic()
+                self._get_pool().putconn(conn, close=bool(conn.closed))
+            with self._lock:
+                self.in_use -= 1
+            slots.release()
+
+    def _forget_prepared(self, conn):
+        # Whatever failed may have left PREPAREs half done; start over rather
+        # than trust the bookkeeping.
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DEALLOCATE ALL")
+            conn.commit()
+        except psycopg2.Error:
+            conn.close()
+        conn.prepared.clear()
+
+    def health(self):
+        start = time.perf_counter()
+        try:
+            with self.connection(timeout_ms=5000) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            ok, error = True, None
+        except Exception as exception:
+            ok, error = False, repr(exception)
+        return {
+            'ok': ok,
+            'error': error,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+            'in_use': self.in_use,
+            'max': self.maxconn,
+        }
+
+#----------
+# Queries
+
+_PARAMETER = re.compile(r"%\((\w+)\)s")
+
+
+def _prepared(query):
+    """Rewrite a pyformat query for PREPARE: '$n' placeholders, in order."""
+    names = []
+
+    def placeholder(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    text = _PARAMETER.sub(placeholder, query).strip().rstrip(";")
+    name = "q_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return name, text, names
+
+
+_statements = {}
+
+
+def read_frame(conn, query, params=None):
+    """Run a query as a prepared statement and return the result as a frame.
+
+    Statements are keyed by their text, prepared once per connection and
+    then executed by name.
+    """
+    if query not in _statements:
+        _statements[query] = _prepared(query)
+    name, text, names = _statements[query]
+    if name not in conn.prepared:
+        with conn.cursor() as cursor:
+            cursor.execute(f"PREPARE {name} AS {text}")
+        conn.prepared.add(name)
+    values = [params[parameter] for parameter in names]
+    arguments = f" ({', '.join(['%s'] * len(values))})" if values else ""
+    return pd.read_sql(f"EXECUTE {name}{arguments}", conn, params=values or None)
+
+
+def begin_snapshot(conn):
+    """Make the rest of this transaction read from one consistent snapshot."""
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+
+database = Database(DATABASE_URL)
+connection = database.connection
@@ -0,0 +1,343 @@
+import fcntl
+import glob
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from urllib.parse import urlencode
+
+import pandas as pd
+from flask import Response, abort, request, send_file, stream_with_context
+
+from aire import data, db
+from aire.snapshot import snapshots
+
+log = logging.getLogger(__name__)
+
+# Rows rendered per chunk; bounds the memory held by each download.
+CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 10000))
+
+# Where full-history artifacts are cached, shared by every worker on the host.
+CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'calidadaire'))
+
+DOWNLOAD_PATH = "/descargar/calidadaire.<formato>"
+
+FILENAME = "calidadaire"
+
+# Seconds a client is asked to wait while a Parquet artifact is built.
+RETRY_AFTER_SECONDS = int(os.environ.get('EXPORT_RETRY_AFTER_SECONDS', 30))
+
+# Download formats and their content types.
+FORMATS = {
+    "csv": "text/csv",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Formats cached as full-history artifacts.
+ARTIFACT_FORMATS = ("csv.gz", "parquet")
+
+# How fecha is written in CSV downloads.
+DATE_FORMAT = "%Y/%m/%d %H:%M"
+
+# Dropdown value that means "every municipio".
+ALL_MUNICIPIOS = "Zona Metropolitana"
+
+#----------
+# Filters
+
+@dataclass(frozen=True)
+class ExportFilters:
+    municipio: str = None
+    sensor_ids: tuple = ()
+    desde: date = None
+    hasta: date = None
+
+    def __bool__(self):
+        return any([self.municipio, self.sensor_ids, self.desde, self.hasta])
+
+
+def _parse_date(value):
+    # Date pickers send either a date or a full ISO timestamp.
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        abort(400, f"Fecha inválida: {value}")
+
+
+def filters_from_args(args):
+    try:
+        sensor_ids = tuple(int(value) for value in args.getlist('sensor'))
+    except ValueError:
+        abort(400, "Sensor inválido")
+    return ExportFilters(
+        municipio=args.get('municipio') or None,
+        sensor_ids=sensor_ids,
+        desde=_parse_date(args['desde']) if args.get('desde') else None,
+        hasta=_parse_date(args['hasta']) if args.get('hasta') else None,
+    )
+
+
+def download_url(municipio=None, start_date=None, end_date=None, formato="csv"):
+    """Link for the download buttons given the sidebar's current values.
+
+    Defaults are left out of the query string so the common case stays on
+    the unfiltered, cacheable path.
+    """
+    path = f"/descargar/{FILENAME}.{formato}"
+    params = {}
+    if municipio and municipio != ALL_MUNICIPIOS:
+        params['municipio'] = municipio
+    if start_date and start_date[:10] > data.START_DATE.isoformat():
+        params['desde'] = start_date[:10]
+    if end_date and end_date[:10] < data.local_now().date().isoformat():
+        params['hasta'] = end_date[:10]
+    if not params:
+        return path
+    return f"{path}?{urlencode(params)}"
+
+#----------
+# Sources
+
+def snapshot_frames(snapshot, chunk_rows=CHUNK_ROWS):
+    """Yield bounded slices of the snapshot's readings, with sensor names joined."""
+    for segment in snapshot.readings.segments:
+        for start in range(0, len(segment), chunk_rows):
+            frame = data.with_sensors(segment.iloc[start:start + chunk_rows], snapshot.sensors)
+            yield frame[data.EXPORT_COLUMNS]
+
+
+def query_frames(filters, chunk_rows=CHUNK_ROWS):
+    """Yield filtered readings straight from a server-side cursor."""
+    predicates, params = data.readings_predicates(
+        municipio=filters.municipio,
+        sensor_ids=filters.sensor_ids,
+        desde=filters.desde,
+        hasta=filters.hasta,
+    )
+    # The pooled connection is held for the whole download, so DB_POOL_MAX
+    # also caps concurrent filtered downloads per worker. A named cursor keeps
+    # the result set on the server; only chunk_rows rows are in memory.
+    with db.connection() as conn:
+        with conn.cursor(name="descarga") as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(data.FILTERED_READINGS_QUERY.format(predicates=predicates), params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=data.EXPORT_COLUMNS)
+
+#----------
+# Writers
+
+def csv_chunks(frames):
+    """Yield CSV text, one chunk per frame."""
+    yield ",".join(data.EXPORT_COLUMNS) + "\n"
+    for frame in frames:
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, date_format=DATE_FORMAT)
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into a single gzip member."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def write_parquet(frames, fileobj):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Fixed up front rather than inferred from the first chunk, whose
+    # all-null or Decimal columns would otherwise decide the file's types.
+    dtypes = {column: data.READING_DTYPES[column] for column in data.EXPORT_COLUMNS if column in data.READING_DTYPES}
+    schema = pa.schema([
+        (column, pa.from_numpy_dtype(dtypes[column]) if column in dtypes else pa.string())
+        for column in data.EXPORT_COLUMNS
+    ])
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame.astype(dtypes), schema=schema, preserve_index=False))
+
+
+def write_artifact(frames, formato, fileobj):
+    if formato == "parquet":
+        write_parquet(frames, fileobj)
+        return
+    chunks = csv_chunks(frames)
+    if formato == "csv.gz":
+        for chunk in gzip_chunks(chunks):
+            fileobj.write(chunk)
+    else:
+        for chunk in chunks:
+            fileobj.write(chunk.encode("utf-8"))
+
+#----------
+# Artifacts
+
+# This worker's on-demand build, when the refresh thread hasn't built one.
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def artifact_path(version, formato):
+    return os.path.join(CACHE_DIR, f"{FILENAME}-{version}.{formato}")
+
+
+def _last_id(version):
+    return int(version.split("-", 1)[0])
+
+
+def artifact_versions(formato):
+    """Versions with a complete artifact on disk, newest readings first."""
+    prefix, suffix = f"{FILENAME}-", f".{formato}"
+    versions = []
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{prefix}*{suffix}")):
+        version = os.path.basename(path)[len(prefix):-len(suffix)]
+        if version.split("-", 1)[0].isdigit():
+            versions.append(version)
+    return sorted(versions, key=_last_id, reverse=True)
+
+
+def current_version(formato, snapshot):
+    """The newest artifact at least as current as the snapshot, or None.
+
+    One with newer readings counts even if its sensors differ; at the same
+    readings, only the snapshot's own version (same registry) does.
+    """
+    for version in artifact_versions(formato):
+        if _last_id(version) > snapshot.readings.last_id or version == snapshot.version:
+            return version
+    return None
+
+
+def build_artifact(snapshot, formato):
+    """Build the full-history file for the snapshot unless one as new exists.
+
+    One lock file per format serializes builds across workers and is never
+    removed. The artifact is written to a temporary name and renamed into
+    place so readers never see a partial file. Workers refresh on their own
+    and may hold different versions, so only versions no newer than the one
+    built are removed; a worker never builds a version older than what's on
+    disk.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, f"{FILENAME}.{formato}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = current_version(formato, snapshot)
+        if current is not None:
+            return artifact_path(current, formato)
+        versions = artifact_versions(formato)
+        path = artifact_path(snapshot.version, formato)
+        start = time.perf_counter()
+        descriptor, partial = tempfile.mkstemp(dir=CACHE_DIR, suffix=".partial")
+        try:
+            with os.fdopen(descriptor, "wb") as fileobj:
+                write_artifact(snapshot_frames(snapshot), formato, fileobj)
+            os.replace(partial, path)
+        except BaseException:
+            os.unlink(partial)
+            raise
+        for old in versions:
+            try:
+                os.unlink(artifact_path(old, formato))
+            except FileNotFoundError:
+                pass
+    log.info("Built %s in %.2fs", os.path.basename(path), time.perf_counter() - start)
+    return path
+
+
+def build_artifacts(snapshot):
+    """Build every cached format for the snapshot, outside of any request."""
+    for formato in ARTIFACT_FORMATS:
+        try:
+            build_artifact(snapshot, formato)
+        except Exception:
+            # Downloads fall back to streaming until a later build succeeds.
+            log.exception("Building the %s artifact failed", formato)
+
+
+def build_in_background(snapshot):
+    """Start build_artifacts unless this worker is already building."""
+    global _builder
+    with _builder_lock:
+        if _builder is not None and _builder.is_alive():
+            return
+        _builder = threading.Thread(target=build_artifacts, args=(snapshot,), name="export-build", daemon=True)
+        _builder.start()
+
+
+# Builds run from the snapshot refresh thread, after each new version is
+# published, so no request waits for one.
+snapshots.subscribe(build_artifacts)
+
+#----------
+# Views
+
+def stream_response(chunks, formato):
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[formato])
+    response.headers["Content-Disposition"] = f"attachment; filename={FILENAME}.{formato}"
+    return response
+
+
+def descargar(formato):
+    if formato not in FORMATS:
+        abort(404)
+    filters = filters_from_args(request.args)
+
+    if filters:
+        # Filtered downloads are one-off, so they're never cached.
+        frames = query_frames(filters)
+        if formato == "parquet":
+            fileobj = tempfile.TemporaryFile()
+            write_parquet(frames, fileobj)
+            fileobj.seek(0)
+            return send_file(fileobj, mimetype=FORMATS[formato], as_attachment=True,
+                             download_name=f"{FILENAME}.{formato}")
+        chunks = csv_chunks(frames)
+        return stream_response(gzip_chunks(chunks) if formato == "csv.gz" else chunks, formato)
+
+    snapshot = snapshots.get()
+    if formato == "csv":
+        # Pin the snapshot for the whole download: its frames are never
+        # mutated, so a refresh mid-stream can't mix two versions.
+        return stream_response(csv_chunks(snapshot_frames(snapshot)), formato)
+
+    # Compressed formats are built once per snapshot version, outside the
+    # request, and revalidated with ETag/Last-Modified (the artifact's
+    # mtime), so repeat downloads usually end in a 304. Another worker may
+    # have built a newer version already; it's served as is.
+    current = current_version(formato, snapshot)
+    if current is not None:
+        try:
+            return send_file(
+                artifact_path(current, formato),
+                mimetype=FORMATS[formato],
+                as_attachment=True,
+                download_name=f"{FILENAME}.{formato}",
+                conditional=True,
+                etag=f"{current}-{formato}",
+                max_age=0,
+            )
+        except FileNotFoundError:
+            # Replaced by an even newer build since it was listed.
+            pass
+
+    build_in_background(snapshot)
+    if formato == "csv.gz":
+        return stream_response(gzip_chunks(csv_chunks(snapshot_frames(snapshot))), formato)
+    response = Response("El archivo se está preparando, intenta de nuevo en unos segundos.\n",
+                        status=202, mimetype="text/plain")
+    response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+    return response
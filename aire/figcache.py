@@ -0,0 +1,180 @@
+"""Cache of serialized figures, keyed by filter state and snapshot version.
+
+Building the scatter plot and the map with plotly takes far longer than
+serving their JSON, so each combination of filters is built once per
+snapshot version and then read back:
+
+    figuras = figures.get_or_build(key, build)
+
+build returns a JSON string; the cached value is handed back parsed, ready
+for a dcc.Graph. Entries expire after FIGURE_CACHE_TTL_SECONDS and the least
+recently used ones are evicted once the cache passes FIGURE_CACHE_MAX_BYTES.
+With FIGURE_CACHE=disk entries live in FIGURE_CACHE_DIR and are shared by
+every worker on the host; the default keeps them in each worker's memory.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# 'memory' (per worker) or 'disk' (shared by the workers on a host).
+FIGURE_CACHE = os.environ.get('FIGURE_CACHE', 'memory')
+
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'calidadaire-figuras'))
+
+FIGURE_CACHE_TTL_SECONDS = float(os.environ.get('FIGURE_CACHE_TTL_SECONDS', 3600))
+
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+#----------
+# Backends
+
+class MemoryBackend:
+
+    def __init__(self, ttl=FIGURE_CACHE_TTL_SECONDS, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if time.monotonic() - created > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), value)
+            self._size += len(value)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+    def size(self):
+        return self._size
+
+
+class DiskBackend:
+    """One file per entry; mtime marks creation and atime the last hit."""
+
+    def __init__(self, directory=FIGURE_CACHE_DIR, ttl=FIGURE_CACHE_TTL_SECONDS, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl:
+                os.unlink(path)
+                return None
+            with open(path, 'rb') as fileobj:
+                value = fileobj.read()
+            # noatime mounts don't record reads, so mark the hit by hand.
+            os.utime(path, (time.time(), stat.st_mtime))
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written aside and renamed, so other workers never read half a file.
+        descriptor, partial = tempfile.mkstemp(dir=self.directory, suffix='.partial')
+        try:
+            with os.fdopen(descriptor, 'wb') as fileobj:
+                fileobj.write(value)
+            os.replace(partial, self._path(key))
+        except BaseException:
+            os.unlink(partial)
+            raise
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                entries.append((path, os.stat(path)))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        size = sum(stat.st_size for _, stat in entries)
+        now = time.time()
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_atime):
+            if size <= self.max_bytes and now - stat.st_mtime <= self.ttl:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+
+    def size(self):
+        return sum(stat.st_size for _, stat in self._entries())
+
+#----------
+# Cache
+
+class FigureCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def get_or_build(self, parts, build):
+        """Return the parsed figure JSON for parts, building it on a miss."""
+        key = self.key(*parts)
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            value = build().encode('utf-8')
+            self.backend.set(key, value)
+        else:
+            self.hits += 1
+        return json.loads(value)
+
+    def status(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes': self.backend.size(),
+            'max_bytes': self.backend.max_bytes,
+        }
+
+
+def from_env():
+    if FIGURE_CACHE == 'disk':
+        return FigureCache(DiskBackend())
+    return FigureCache(MemoryBackend())
+
+
+figures = from_env()
@@ -0,0 +1,203 @@
+"""Server-side rows for AG Grid's infinite row model.
+
+A grid with rowModelType="infinite" asks for one block of rows at a time
+through getRowsRequest (startRow, endRow, sortModel, filterModel); the
+callback answers with getRowsResponse from rows(). Only the visible blocks
+ever reach the browser, so a grid can page through the full readings history.
+
+The unfiltered frame of a view is built once and shared by its filters and
+sorts; each of those only keeps the positions of its rows. Columns that come
+from a small side table, like sensor names, stay out of the frame: they're
+filtered and sorted through that table and joined onto each block alone.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Filtered, sorted row positions kept per worker.
+GRID_CACHE_SIZE = int(os.environ.get('GRID_CACHE_SIZE', 8))
+
+# Unfiltered frames kept per worker.
+GRID_FRAME_CACHE_SIZE = int(os.environ.get('GRID_FRAME_CACHE_SIZE', 2))
+
+# Decimals sent for float columns, the sensors' own precision; float32
+# values carry noise past it.
+DECIMALS = 1
+
+# How datetimes are sent to the browser.
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+#----------
+# Filters
+
+def _text_mask(values, condition):
+    values = values.astype(str).str.lower()
+    text = str(condition.get('filter') or '').lower()
+    kind = condition.get('type', 'contains')
+    if kind == 'contains':
+        return values.str.contains(text, regex=False)
+    if kind == 'notContains':
+        return ~values.str.contains(text, regex=False)
+    if kind == 'equals':
+        return values == text
+    if kind == 'notEqual':
+        return values != text
+    if kind == 'startsWith':
+        return values.str.startswith(text)
+    if kind == 'endsWith':
+        return values.str.endswith(text)
+    return pd.Series(True, index=values.index)
+
+
+def _range_mask(values, kind, low, high):
+    if kind == 'equals':
+        return values == low
+    if kind == 'notEqual':
+        return values != low
+    if kind == 'lessThan':
+        return values < low
+    if kind == 'lessThanOrEqual':
+        return values <= low
+    if kind == 'greaterThan':
+        return values > low
+    if kind == 'greaterThanOrEqual':
+        return values >= low
+    if kind == 'inRange':
+        return (values >= low) & (values <= high)
+    if kind == 'blank':
+        return values.isna()
+    if kind == 'notBlank':
+        return values.notna()
+    return pd.Series(True, index=values.index)
+
+
+def _condition_mask(values, condition):
+    if 'operator' in condition:
+        # Two conditions joined by AND/OR.
+        first = _condition_mask(values, condition['condition1'])
+        second = _condition_mask(values, condition['condition2'])
+        return first & second if condition['operator'] == 'AND' else first | second
+    filter_type = condition.get('filterType', 'text')
+    if filter_type == 'number':
+        return _range_mask(values, condition.get('type'), condition.get('filter'), condition.get('filterTo'))
+    if filter_type == 'date':
+        low = pd.Timestamp(condition['dateFrom']) if condition.get('dateFrom') else None
+        high = pd.Timestamp(condition['dateTo']) if condition.get('dateTo') else None
+        kind = condition.get('type')
+        if kind == 'equals':
+            # Dates compare by day; the column holds full timestamps.
+            return values.dt.normalize() == low
+        return _range_mask(values, kind, low, high)
+    return _text_mask(values, condition)
+
+
+def filter_positions(frame, filter_model, lookups):
+    """Positions of the frame's rows that pass every column filter."""
+    mask = np.ones(len(frame), dtype=bool)
+    for column, condition in (filter_model or {}).items():
+        if column in frame.columns:
+            mask &= _condition_mask(frame[column], condition).to_numpy(dtype=bool)
+        elif column in lookups:
+            key, values = lookups[column]
+            matches = values.index[_condition_mask(values, condition).to_numpy(dtype=bool)]
+            mask &= frame[key].isin(matches).to_numpy()
+    # Row counts fit in 32 bits and halve the cached size.
+    return np.flatnonzero(mask).astype(np.int32)
+
+
+def sort_positions(frame, positions, sort_model, lookups):
+    """positions reordered by the sort model; ties keep their order."""
+    keys, ascending = {}, []
+    for sort in sort_model or []:
+        column = sort['colId']
+        if column in frame.columns:
+            keys[column] = frame[column].iloc[positions].reset_index(drop=True)
+        elif column in lookups:
+            key, values = lookups[column]
+            # Rank the side table once, then sort the rows by rank.
+            ranks = values.astype(object).rank(method='dense')
+            keys[column] = frame[key].iloc[positions].map(ranks).reset_index(drop=True)
+        else:
+            continue
+        ascending.append(sort['sort'] == 'asc')
+    if not keys:
+        return positions
+    order = pd.DataFrame(keys).sort_values(by=list(keys), ascending=ascending, kind='mergesort').index
+    return positions[order.to_numpy()]
+
+#----------
+# Rows
+
+@dataclass(frozen=True)
+class View:
+    """A grid's unfiltered frame and the positions of its rows, in order."""
+    frame: pd.DataFrame
+    positions: np.ndarray
+    # Column -> (key column in frame, values indexed by key).
+    lookups: dict
+
+
+_frames = OrderedDict()
+_positions = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(cache, key, build, size):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = build()
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return value
+
+
+def prepared(key, request, build, lookups=None):
+    """The view for a request, filtered and sorted as it asks.
+
+    key identifies the unfiltered frame (snapshot version and sidebar values);
+    build returns it on a miss. lookups maps columns kept out of that frame
+    to (key column, values indexed by key), e.g. sensor names by sensor_id.
+    """
+    lookups = lookups or {}
+    frame = _cached(_frames, key, build, GRID_FRAME_CACHE_SIZE)
+    filter_model = request.get('filterModel') or {}
+    sort_model = request.get('sortModel') or []
+    view_key = key + (json.dumps(filter_model, sort_keys=True), json.dumps(sort_model))
+    positions = _cached(
+        _positions,
+        view_key,
+        lambda: sort_positions(frame, filter_positions(frame, filter_model, lookups), sort_model, lookups),
+        GRID_CACHE_SIZE,
+    )
+    return View(frame, positions, lookups)
+
+
+def rows(view, request):
+    """The getRowsResponse for one block of a prepared view."""
+    start = int(request.get('startRow') or 0)
+    end = int(request.get('endRow') or start + 100)
+    block = view.frame.iloc[view.positions[start:end]]
+    block = block.assign(**{
+        column: block[key].map(values) for column, (key, values) in view.lookups.items()
+    })
+    for column in block.columns:
+        if pd.api.types.is_datetime64_any_dtype(block[column]):
+            block[column] = block[column].dt.strftime(DATE_FORMAT)
+        elif pd.api.types.is_categorical_dtype(block[column]):
+            block[column] = block[column].astype(object)
+        elif pd.api.types.is_float_dtype(block[column]):
+            # Widen first: a float32 12.3 would otherwise reach the browser
+            # as 12.300000190734863.
+            block[column] = block[column].astype('float64').round(DECIMALS)
+    # NaN isn't valid JSON.
+    block = block.astype(object).where(block.notna(), None)
+    return {'rowData': block.to_dict('records'), 'rowCount': len(view.positions)}
@@ -0,0 +1,9 @@
+"""Ingestion of PurpleAir readings into air_quality.
+
+Replaces the notebook's fetch_sensor_data loop. Run one cycle with:
+
+    python -m aire.ingest
+
+or keep polling as a long-lived worker with --worker. aire.ingest.fake
+serves a local stand-in for the PurpleAir API to run against.
+"""
@@ -0,0 +1,177 @@
+"""Fetch the sensors' current readings and store them in air_quality.
+
+    python -m aire.ingest [--sensor ID ...]     # one cycle
+    python -m aire.ingest --worker              # every INGEST_INTERVAL_SECONDS
+
+Without --sensor every sensor in the registry (aire.sensores) is polled,
+so sensors added to or removed from it are picked up by the next cycle. Each
+cycle is written in one batch (see aire.ingest.writer), then the rollups are
+brought up to date (see aire.rollups).
+
+As a worker, cycles run on aligned ticks (see aire.ingest.scheduler) until
+SIGTERM or SIGINT, which let the current cycle finish. Only the worker
+holding the ingestion advisory lock polls; others stand by and take over
+when its session ends.
+
+While the database is unreachable the polling worker keeps fetching and
+appends each cycle to a local buffer (see aire.ingest.buffer); the buffer
+is replayed, oldest first, before the next cycle that can reach it. Only the
+lock holder replays, so air_quality always has a single writer.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+import psycopg2
+
+from aire import db, rollups, sensores
+from aire.ingest import purpleair, writer
+from aire.ingest.buffer import Buffer
+from aire.ingest.scheduler import INGEST_CATCH_UP, INGEST_INTERVAL_SECONDS, INGEST_OFFSET_SECONDS, Scheduler
+
+log = logging.getLogger('aire.ingest')
+
+# Session advisory lock key; one ingesting worker at a time.
+LOCK_KEY = 'aire.ingest'
+
+
+def store(conn, readings, buffer):
+    """Write buffered readings, then these; buffer them if a write fails."""
+    try:
+        replayed = buffer.replay(lambda batch: writer.write_readings(conn, batch))
+        written = writer.write_readings(conn, readings)
+    except psycopg2.Error:
+        log.warning("Database write failed, buffering %s readings", len(readings), exc_info=True)
+        buffer.append(readings)
+        raise
+    if replayed:
+        log.info("Replayed %s buffered readings", replayed)
+    # The readings are committed by now; a failure here only delays the
+    # rollups to the next cycle.
+    rollups.update(conn)
+    return written
+
+
+class Worker:
+    """One connection, the advisory lock on it, and the cycle to run per tick."""
+
+    def __init__(self, sensor_ids=None, buffer=None):
+        self.sensor_ids = sensor_ids
+        self.buffer = buffer or Buffer()
+        self.conn = None
+        self.leader = False
+        # Whether this worker is the one polling; kept through outages,
+        # when the lock's session is gone but nobody else can take over.
+        self.polling = False
+        self.known_ids = None
+
+    def connection(self):
+        if self.conn is None or self.conn.closed:
+            # A new session no longer holds the lock.
+            self.conn = db.connect()
+            self.leader = False
+        return self.conn
+
+    def _reachable(self):
+        try:
+            return self.connection()
+        except psycopg2.OperationalError:
+            log.warning("Database unreachable")
+            return None
+
+    def _lead(self, conn):
+        if not self.leader:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_KEY,))
+                self.leader = cursor.fetchone()[0]
+            conn.commit()
+            if self.leader:
+                log.info("Holding the ingestion lock")
+            self.polling = self.leader
+        return self.leader
+
+    def __call__(self, tick=None):
+        try:
+            conn = self._reachable()
+            if conn is not None:
+                try:
+                    if not self._lead(conn):
+                        # Buffered readings wait for the lock too: a second writer
+                        # would commit pollution_ids out of order, and the rollups'
+                        # and snapshots' id watermarks would skip the late ones.
+                        log.info("Another worker is ingesting; standing by")
+                        return
+                    self.known_ids = self.sensor_ids or sensores.registry.ids(conn)
+                    conn.commit()
+                except psycopg2.Error:
+                    # The session is unusable (the registry may have kept its
+                    # frame after the failure); poll and buffer as if offline.
+                    log.warning("Database failed before polling", exc_info=True)
+                    self.close()
+                    conn = None
+            if conn is None and (not self.polling or not (self.sensor_ids or self.known_ids)):
+                return
+            readings, failed = asyncio.run(purpleair.fetch(self.sensor_ids or self.known_ids))
+            if conn is None:
+                self.buffer.append(readings)
+                log.info("Buffered %s readings, %s bytes pending", len(readings), self.buffer.pending_bytes())
+                return
+            written = store(conn, readings, self.buffer)
+            log.info("Stored %s new readings of %s, %s sensors failed", written, len(readings), len(failed))
+        except psycopg2.Error:
+            # Drop the session; the next tick reconnects.
+            self.close()
+            raise
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+        self.leader = False
+
+#----------
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PurpleAir readings.")
+    parser.add_argument('--sensor', type=int, action='append',
+                        help="poll only this sensor (repeatable); default: the sensor registry")
+    parser.add_argument('--load-sensors', metavar='CSV',
+                        help="first insert or update the sensors table from CSV (e.g. assets/sensores.csv)")
+    parser.add_argument('--worker', action='store_true',
+                        help="keep running, one cycle per aligned tick")
+    parser.add_argument('--interval', type=float, default=INGEST_INTERVAL_SECONDS,
+                        help="seconds between ticks (default: %(default)s)")
+    parser.add_argument('--offset', type=float, default=INGEST_OFFSET_SECONDS,
+                        help="seconds after each aligned tick to run at")
+    parser.add_argument('--catch-up', type=int, default=INGEST_CATCH_UP,
+                        help="missed ticks to run after an overrun")
+    parser.add_argument('--metrics-file', help="write scheduler metrics as JSON after every cycle")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    worker = Worker(args.sensor)
+    try:
+        if args.load_sensors:
+            rows = [
+                (int(sensor_id), nombre, municipio, float(lat), float(lon))
+                for sensor_id, nombre, municipio, lat, lon
+                in sensores.read_csv(args.load_sensors).reset_index().itertuples(index=False, name=None)
+            ]
+            count = writer.write_sensors(worker.connection(), rows)
+            log.info("Loaded %s sensors from %s", count, args.load_sensors)
+        if not args.worker:
+            worker()
+            return
+        scheduler = Scheduler(worker, interval=args.interval, offset=args.offset,
+                              catch_up=args.catch_up, metrics_file=args.metrics_file)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: scheduler.stop())
+        scheduler.run()
+    finally:
+        worker.close()
+
+
+if __name__ == '__main__':
+    main()
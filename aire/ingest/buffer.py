@@ -0,0 +1,159 @@
+"""Local write-ahead buffer for readings the database couldn't take.
+
+When Postgres is unreachable the worker appends the cycle's readings to
+append-only segment files in INGEST_BUFFER_DIR, one JSON line per reading,
+fsynced before the cycle ends. Once the database is back, replay() hands
+them to the writer oldest first, INGEST_REPLAY_BATCH lines at a time, so
+memory stays bounded however long the outage was. The offset reached is
+checkpointed after each batch and a segment is deleted once fully delivered.
+A crash mid-batch sends that batch again, which the writer's upsert on
+(sensor_id, ts) ignores.
+
+Every worker on a host shares the directory, so whichever holds the
+ingestion lock next replays what another left behind. Appends and replays
+take an flock on the directory's buffer.lock, so a replay never deletes a
+segment another process is appending to.
+
+Point INGEST_BUFFER_DIR at storage that survives a restart; the default
+under the temp directory is only meant for development.
+"""
+import contextlib
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from aire.ingest.purpleair import Reading
+
+log = logging.getLogger(__name__)
+
+INGEST_BUFFER_DIR = os.environ.get('INGEST_BUFFER_DIR', os.path.join(tempfile.gettempdir(), 'calidadaire-ingest'))
+
+# A new segment is started once the current one reaches this size.
+INGEST_BUFFER_SEGMENT_BYTES = int(os.environ.get('INGEST_BUFFER_SEGMENT_BYTES', 16 * 1024 * 1024))
+
+# Readings per replayed write.
+INGEST_REPLAY_BATCH = int(os.environ.get('INGEST_REPLAY_BATCH', 5000))
+
+
+def encode(reading):
+    return json.dumps({
+        'sensor_id': reading.sensor_id,
+        'pm25': reading.pm25,
+        'humidity': reading.humidity,
+        'temp_celsius': reading.temp_celsius,
+        'fecha': reading.fecha.isoformat(),
+    }).encode('utf-8') + b'\n'
+
+
+def decode(line):
+    values = json.loads(line)
+    values['fecha'] = datetime.fromisoformat(values['fecha'])
+    return Reading(**values)
+
+
+class Buffer:
+
+    def __init__(self, directory=INGEST_BUFFER_DIR, segment_bytes=INGEST_BUFFER_SEGMENT_BYTES,
+                 batch_rows=INGEST_REPLAY_BATCH):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_rows = batch_rows
+
+    def segments(self):
+        """Segment paths, oldest first; names are zero-padded sequence numbers."""
+        return sorted(glob.glob(os.path.join(self.directory, '*.jsonl')))
+
+    def _checkpoint_path(self, segment):
+        return segment[:-len('.jsonl')] + '.offset'
+
+    def _checkpoint(self, segment):
+        try:
+            with open(self._checkpoint_path(segment)) as fileobj:
+                return int(fileobj.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _save_checkpoint(self, segment, offset):
+        path = self._checkpoint_path(segment)
+        partial = path + '.partial'
+        with open(partial, 'w') as fileobj:
+            fileobj.write(str(offset))
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.replace(partial, path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'buffer.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _current_segment(self):
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            return segments[-1]
+        sequence = int(os.path.basename(segments[-1])[:-len('.jsonl')]) + 1 if segments else 1
+        return os.path.join(self.directory, f"{sequence:012d}.jsonl")
+
+    def append(self, readings):
+        """Durably add readings to the end of the buffer."""
+        if not readings:
+            return
+        with self._locked():
+            segment = self._current_segment()
+            with open(segment, 'ab') as fileobj:
+                # A crash mid-write leaves a partial last line; end it first.
+                if fileobj.tell() and not self._ends_with_newline(segment):
+                    fileobj.write(b'\n')
+                fileobj.write(b''.join(encode(reading) for reading in readings))
+                fileobj.flush()
+                os.fsync(fileobj.fileno())
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as fileobj:
+            fileobj.seek(-1, os.SEEK_END)
+            return fileobj.read(1) == b'\n'
+
+    def pending_bytes(self):
+        with self._locked():
+            return sum(os.path.getsize(segment) - self._checkpoint(segment) for segment in self.segments())
+
+    def replay(self, write):
+        """Deliver every buffered reading through write(batch), oldest first.
+
+        Stops at the first failed write, keeping the rest for the next call.
+        Returns the number of readings delivered.
+        """
+        delivered = 0
+        with self._locked():
+            for segment in self.segments():
+                with open(segment, 'rb') as fileobj:
+                    fileobj.seek(self._checkpoint(segment))
+                    batch = []
+                    while True:
+                        line = fileobj.readline()
+                        if line.strip():
+                            try:
+                                batch.append(decode(line))
+                            except (ValueError, TypeError, KeyError):
+                                log.warning("Skipping unreadable line in %s", segment)
+                        if batch and (len(batch) >= self.batch_rows or not line):
+                            write(batch)
+                            delivered += len(batch)
+                            self._save_checkpoint(segment, fileobj.tell())
+                            batch = []
+                        if not line:
+                            break
+                os.unlink(segment)
+                try:
+                    os.unlink(self._checkpoint_path(segment))
+                except FileNotFoundError:
+                    pass
+                log.info("Replayed %s", os.path.basename(segment))
+        return delivered
@@ -0,0 +1,117 @@
+"""A local stand-in for the PurpleAir API.
+
+Answers /v1/sensors/{id} and group requests (/v1/sensors?show_only=...)
+for any id with made-up values after a delay, and can fail or rate limit a
+share of requests, or leave sensors out of group answers, to try the
+ingestion against:
+
+    python -m aire.ingest.fake --latency 0.3 --error-rate 0.1 --missing-rate 0.05
+    PURPLEAIR_API_URL=http://localhost:8081/v1 python -m aire.ingest --sensor 96317
+
+It logs the requests it served, and the most it had in flight at once, on exit.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+
+class FakePurpleAir:
+
+    def __init__(self, latency=0.2, jitter=0.0, error_rate=0.0, rate_limit=0, missing_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Share of sensors left out of group answers, as if offline.
+        self.missing_rate = missing_rate
+        # Requests allowed per second before answering 429; 0 is unlimited.
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.served = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._second = 0
+        self._second_count = 0
+
+    def _over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        second = int(time.monotonic())
+        if second != self._second:
+            self._second, self._second_count = second, 0
+        self._second_count += 1
+        return self._second_count > self.rate_limit
+
+    def _sensor(self, sensor_id):
+        return {
+            'sensor_index': sensor_id,
+            'last_seen': int(time.time()),
+            'pm2.5': round(self.random.uniform(2, 90), 1),
+            'humidity': self.random.randint(15, 80),
+            'temperature': self.random.randint(55, 105),
+        }
+
+    async def _answer(self, body):
+        if self._over_rate_limit():
+            return web.json_response({'error': 'RateLimitExceeded'}, status=429, headers={'Retry-After': '1'})
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+            self.served += 1
+            if self.random.random() < self.error_rate:
+                return web.json_response({'error': 'InternalError'}, status=503)
+            now = int(time.time())
+            return web.json_response({'api_version': 'fake', 'time_stamp': now, 'data_time_stamp': now, **body()})
+        finally:
+            self.in_flight -= 1
+
+    async def sensor(self, request):
+        sensor_id = int(request.match_info['sensor_id'])
+        return await self._answer(lambda: {'sensor': self._sensor(sensor_id)})
+
+    async def group(self, request):
+        sensor_ids = [int(value) for value in request.query.get('show_only', '').split(',') if value]
+        fields = ['sensor_index'] + [field for field in request.query.get('fields', '').split(',') if field]
+
+        def body():
+            sensors = [self._sensor(sensor_id) for sensor_id in sensor_ids if self.random.random() >= self.missing_rate]
+            return {'fields': fields, 'data': [[sensor.get(field) for field in fields] for sensor in sensors]}
+
+        return await self._answer(body)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/v1/sensors', self.group)
+        app.router.add_get('/v1/sensors/{sensor_id:\\d+}', self.sensor)
+        return app
+
+#----------
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake PurpleAir API.")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds before each answer")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument('--rate-limit', type=int, default=0, help="requests per second before 429s")
+    parser.add_argument('--missing-rate', type=float, default=0.0, help="share of sensors left out of group answers")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    fake = FakePurpleAir(args.latency, args.jitter, args.error_rate, args.rate_limit, args.missing_rate, args.seed)
+    try:
+        web.run_app(fake.app(), port=args.port)
+    finally:
+        log.info("Served %s requests, at most %s at once", fake.served, fake.max_in_flight)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Asynchronous PurpleAir API client.
+
+A cycle asks for its sensors in groups of PURPLEAIR_BATCH_SIZE through
+/sensors?show_only=..., one request per group, and all groups at once, so
+~100 sensors cost one API call and about one round trip:
+
+    readings, failed = asyncio.run(purpleair.fetch(sensor_ids))
+
+Sensors in a group whose request failed are then asked for one by one
+through /sensors/{id}, with at most PURPLEAIR_CONCURRENCY requests in
+flight. Sensors missing from a group's answer haven't reported within
+MAX_AGE_SECONDS and are skipped until they do; asking for them one by one
+would only add a request per offline sensor to every cycle.
+
+Each request gives up after PURPLEAIR_TIMEOUT_SECONDS. Timeouts, connection
+errors and 5xx responses are retried up to PURPLEAIR_RETRIES times with
+jittered exponential backoff. A 429 pauses every request of the client for
+the Retry-After the API asks for, including those already waiting for a
+slot, and is retried after the pause without using up a retry; a request
+gives up after PURPLEAIR_RATE_LIMIT_RETRIES of them. PURPLEAIR_API_URL
+points the client elsewhere, such as aire.ingest.fake.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+PURPLEAIR_API_URL = os.environ.get('PURPLEAIR_API_URL', 'https://api.purpleair.com/v1')
+
+PURPLEAIR_API_KEY = os.environ.get('PURPLEAIR_API_KEY')
+
+# Sensors per group request; their ids go in the query string.
+PURPLEAIR_BATCH_SIZE = int(os.environ.get('PURPLEAIR_BATCH_SIZE', 250))
+
+# Requests in flight at once.
+PURPLEAIR_CONCURRENCY = int(os.environ.get('PURPLEAIR_CONCURRENCY', 128))
+
+PURPLEAIR_TIMEOUT_SECONDS = float(os.environ.get('PURPLEAIR_TIMEOUT_SECONDS', 10))
+
+PURPLEAIR_RETRIES = int(os.environ.get('PURPLEAIR_RETRIES', 3))
+
+# First retry waits up to this long; each later one up to twice as long.
+PURPLEAIR_BACKOFF_SECONDS = float(os.environ.get('PURPLEAIR_BACKOFF_SECONDS', 0.5))
+
+# 429s a request waits out before giving up; they don't count as retries.
+PURPLEAIR_RATE_LIMIT_RETRIES = int(os.environ.get('PURPLEAIR_RATE_LIMIT_RETRIES', 20))
+
+# Wait after a 429 without a usable Retry-After.
+RATE_LIMIT_SECONDS = 10.0
+
+FIELDS = 'pm2.5,humidity,temperature,last_seen'
+
+# Group answers only include sensors seen within this many seconds.
+MAX_AGE_SECONDS = 3600
+
+
+class TransientError(Exception):
+    """A failure worth retrying: 5xx."""
+
+
+class RateLimited(Exception):
+    """A 429; retried once the client's pause is over."""
+
+
+@dataclass(frozen=True)
+class Reading:
+    sensor_id: int
+    pm25: float
+    humidity: float
+    temp_celsius: float
+    # UTC time the sensor last reported.
+    fecha: datetime
+
+
+def fahrenheit_to_celsius(temperature):
+    # Same conversion and rounding the notebook stored.
+    if temperature is None:
+        return None
+    return float(round((temperature - 32) * .5556))
+
+
+def parse_sensor(sensor_id, payload):
+    """A Reading from a /sensors/{id} response, or None if it has no sensor."""
+    sensor = payload.get('sensor')
+    if not sensor:
+        return None
+    seen = sensor.get('last_seen') or payload.get('data_time_stamp')
+    fecha = datetime.fromtimestamp(seen, timezone.utc) if seen else datetime.now(timezone.utc)
+    return Reading(
+        sensor_id=int(sensor_id),
+        pm25=sensor.get('pm2.5'),
+        humidity=sensor.get('humidity'),
+        temp_celsius=fahrenheit_to_celsius(sensor.get('temperature')),
+        fecha=fecha,
+    )
+
+
+def parse_group(payload):
+    """Readings by sensor_id from a /sensors response's fields and data rows."""
+    fields = payload.get('fields') or []
+    readings = {}
+    for row in payload.get('data') or []:
+        sensor = dict(zip(fields, row))
+        sensor_id = sensor.get('sensor_index')
+        if sensor_id is not None:
+            readings[int(sensor_id)] = parse_sensor(sensor_id, {'sensor': sensor, 'data_time_stamp': payload.get('data_time_stamp')})
+    return readings
+
+
+def chunks(values, size):
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+def _retry_after(response):
+    try:
+        return max(float(response.headers.get('Retry-After')), 0.0)
+    except (TypeError, ValueError):
+        return RATE_LIMIT_SECONDS
+
+#----------
+# Client
+
+class PurpleAir:
+
+    def __init__(self, session, api_key=PURPLEAIR_API_KEY, base_url=PURPLEAIR_API_URL,
+                 concurrency=PURPLEAIR_CONCURRENCY, timeout=PURPLEAIR_TIMEOUT_SECONDS,
+                 retries=PURPLEAIR_RETRIES, backoff=PURPLEAIR_BACKOFF_SECONDS,
+                 rate_limit_retries=PURPLEAIR_RATE_LIMIT_RETRIES):
+        self.session = session
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limit_retries = rate_limit_retries
+        self.requests = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        # Monotonic time before which no request is sent, after a 429.
+        self._paused_until = 0.0
+
+    async def _wait_for_rate_limit(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _get_once(self, path, params):
+        async with self._slots:
+            # Checked once the slot is ours, so requests that were queued
+            # when a 429 came in wait too.
+            await self._wait_for_rate_limit()
+            self.requests += 1
+            async with self.session.get(
+                f"{self.base_url}{path}",
+                params=params,
+                headers={'X-API-Key': self.api_key or ''},
+                timeout=self.timeout,
+            ) as response:
+                if response.status == 429:
+                    self._paused_until = max(self._paused_until, time.monotonic() + _retry_after(response))
+                    raise RateLimited(f"429 from {path}")
+                if response.status >= 500:
+                    raise TransientError(f"{response.status} from {path}")
+                # Other 4xx (bad key, unknown sensor) won't get better.
+                response.raise_for_status()
+                return await response.json()
+
+    async def get(self, path, params=None):
+        """JSON body of a GET, retried as described in the module docstring."""
+        attempt = rate_limited = 0
+        while True:
+            try:
+                return await self._get_once(path, params)
+            except RateLimited:
+                # The pause itself is the back-off.
+                rate_limited += 1
+                if rate_limited > self.rate_limit_retries:
+                    raise
+                continue
+            except (TransientError, asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as error:
+                if attempt == self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                log.debug("Retrying %s in %.2fs after %r", path, delay, error)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def sensor(self, sensor_id):
+        payload = await self.get(f"/sensors/{sensor_id}", {'fields': FIELDS})
+        return parse_sensor(sensor_id, payload)
+
+    async def group(self, sensor_ids):
+        payload = await self.get("/sensors", {
+            'fields': FIELDS,
+            'show_only': ",".join(str(sensor_id) for sensor_id in sensor_ids),
+            'max_age': MAX_AGE_SECONDS,
+        })
+        return parse_group(payload)
+
+    async def each(self, sensor_ids):
+        """Readings of every sensor that answered, and the ids of those that didn't.
+
+        One request per sensor.
+        """
+        sensor_ids = list(sensor_ids)
+        results = await asyncio.gather(*(self.sensor(sensor_id) for sensor_id in sensor_ids), return_exceptions=True)
+        readings, failed = [], []
+        for sensor_id, result in zip(sensor_ids, results):
+            if isinstance(result, Exception):
+                log.warning("Sensor %s failed: %r", sensor_id, result)
+                failed.append(sensor_id)
+            elif result is not None:
+                readings.append(result)
+        return readings, failed
+
+    async def sensors(self, sensor_ids, batch_size=PURPLEAIR_BATCH_SIZE):
+        """Like each(), but through group requests, falling back to each() for failed groups."""
+        sensor_ids = list(dict.fromkeys(sensor_ids))
+        groups = chunks(sensor_ids, batch_size)
+        results = await asyncio.gather(*(self.group(group) for group in groups), return_exceptions=True)
+        readings, missing, stale = [], [], 0
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                log.warning("Group of %s sensors failed: %r", len(group), result)
+                missing += group
+                continue
+            found = [result[sensor_id] for sensor_id in group if result.get(sensor_id) is not None]
+            stale += len(group) - len(found)
+            readings += found
+        if stale:
+            log.info("Skipping %s sensors not seen in the last %ss", stale, MAX_AGE_SECONDS)
+        failed = []
+        if missing:
+            log.info("Asking %s sensors one by one", len(missing))
+            more, failed = await self.each(missing)
+            readings += more
+        return readings, failed
+
+
+async def fetch(sensor_ids, batch_size=PURPLEAIR_BATCH_SIZE, **kwargs):
+    """Fetch one cycle's readings with a client of its own."""
+    concurrency = kwargs.get('concurrency', PURPLEAIR_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        client = PurpleAir(session, **kwargs)
+        start = time.perf_counter()
+        readings, failed = await client.sensors(sensor_ids, batch_size)
+        log.info("Fetched %s sensors in %.2fs (%s requests, %s failed)",
+                 len(readings), time.perf_counter() - start, client.requests, len(failed))
+        return readings, failed
@@ -0,0 +1,150 @@
+"""Wall-clock aligned polling for the ingestion worker.
+
+Ticks fall on multiples of the interval (every 5 minutes means :00, :05,
+:10, ...), plus an optional offset, and are computed from the tick itself
+rather than from when the last cycle ended, so they never drift:
+
+    Scheduler(job, interval=300).run()
+
+Cycles never overlap: the loop runs one at a time. A cycle that overruns
+pushes back on the schedule instead of queueing work. The ticks it covered
+are counted as missed and at most catch_up of them are run straight away,
+one after another. PurpleAir only serves current values, so the default of
+1 runs a single fresh cycle in place of all the missed ones. Every cycle
+reports its duration and its lag behind the tick; status() has the totals,
+which are also written to metrics_file when one is set.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+log = logging.getLogger(__name__)
+
+INGEST_INTERVAL_SECONDS = float(os.environ.get('INGEST_INTERVAL_SECONDS', 300))
+
+# Seconds after each aligned tick the cycle runs at.
+INGEST_OFFSET_SECONDS = float(os.environ.get('INGEST_OFFSET_SECONDS', 0))
+
+# Missed ticks run back to back after an overrun.
+INGEST_CATCH_UP = int(os.environ.get('INGEST_CATCH_UP', 1))
+
+INGEST_METRICS_FILE = os.environ.get('INGEST_METRICS_FILE')
+
+
+class Scheduler:
+
+    def __init__(self, job, interval=INGEST_INTERVAL_SECONDS, offset=INGEST_OFFSET_SECONDS,
+                 catch_up=INGEST_CATCH_UP, metrics_file=INGEST_METRICS_FILE, clock=time.time):
+        self.job = job
+        self.interval = interval
+        self.offset = offset
+        self.catch_up = catch_up
+        self.metrics_file = metrics_file
+        self.clock = clock
+        self._stop = threading.Event()
+        self.cycles = 0
+        self.failures = 0
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.last_tick = None
+        self.last_duration = None
+        self.last_lag = None
+        self.max_duration = 0.0
+        self.max_lag = 0.0
+        self.last_error = None
+
+    def next_tick(self, now):
+        """The first aligned tick after now."""
+        return (math.floor((now - self.offset) / self.interval) + 1) * self.interval + self.offset
+
+    def stop(self):
+        self._stop.set()
+
+    def _wait_until(self, tick):
+        # Event.wait rather than sleep, so stop() takes effect right away.
+        while not self._stop.is_set():
+            remaining = tick - self.clock()
+            if remaining <= 0:
+                return True
+            self._stop.wait(remaining)
+        return False
+
+    def _run_once(self, tick):
+        start = self.clock()
+        lag = start - tick
+        try:
+            self.job(datetime.fromtimestamp(tick, timezone.utc))
+        except Exception as error:
+            self.failures += 1
+            self.last_error = repr(error)
+            log.exception("Cycle for %s failed", datetime.fromtimestamp(tick, timezone.utc).isoformat())
+        duration = self.clock() - start
+        self.cycles += 1
+        self.last_tick = tick
+        self.last_duration = duration
+        self.last_lag = lag
+        self.max_duration = max(self.max_duration, duration)
+        self.max_lag = max(self.max_lag, lag)
+        log.info("Cycle %s took %.2fs, %.2fs after its tick", self.cycles, duration, lag)
+        self._write_metrics()
+
+    def run(self):
+        """Run cycles on every tick until stop() is called."""
+        tick = self.next_tick(self.clock())
+        while self._wait_until(tick):
+            self._run_once(tick)
+            tick += self.interval
+            now = self.clock()
+            if now < tick:
+                continue
+            # Overran: the ticks up to now are gone.
+            self.overruns += 1
+            missed = math.floor((now - tick) / self.interval) + 1
+            self.missed_ticks += missed
+            log.warning("Cycle overran by %.2fs, %s ticks missed, running %s now",
+                        now - tick, missed, min(missed, self.catch_up))
+            # The most recent of the missed ticks, oldest first.
+            latest = tick + (missed - 1) * self.interval
+            for back in reversed(range(min(missed, self.catch_up))):
+                if self._stop.is_set():
+                    return
+                self._run_once(latest - back * self.interval)
+            tick = self.next_tick(self.clock())
+
+    def status(self):
+        return {
+            'interval_seconds': self.interval,
+            'cycles': self.cycles,
+            'failures': self.failures,
+            'overruns': self.overruns,
+            'missed_ticks': self.missed_ticks,
+            'last_tick': datetime.fromtimestamp(self.last_tick, timezone.utc).isoformat() if self.last_tick else None,
+            'last_duration_seconds': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'last_lag_seconds': round(self.last_lag, 3) if self.last_lag is not None else None,
+            'max_duration_seconds': round(self.max_duration, 3),
+            'max_lag_seconds': round(self.max_lag, 3),
+            'last_error': self.last_error,
+        }
+
+    def _write_metrics(self):
+        if not self.metrics_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.metrics_file))
+        # Written aside and renamed, so readers never see half a file.
+        try:
+            descriptor, partial = tempfile.mkstemp(dir=directory, suffix='.partial')
+            try:
+                with os.fdopen(descriptor, 'w') as fileobj:
+                    json.dump(self.status(), fileobj)
+                os.replace(partial, self.metrics_file)
+            except BaseException:
+                os.unlink(partial)
+                raise
+        except OSError:
+            # Metrics must never stop the ingestion.
+            log.warning("Could not write %s", self.metrics_file, exc_info=True)
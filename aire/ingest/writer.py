@@ -0,0 +1,58 @@
+"""Batched writes of a cycle's readings and of the sensor list.
+
+A whole cycle is written with one statement in one transaction: a single
+multi-row INSERT (psycopg2's execute_values). Readings upsert on
+(sensor_id, ts), see migrations/002_air_quality_sensor_ts_unique.sql, so a
+retried cycle never stores a reading twice.
+"""
+from psycopg2.extras import execute_values
+
+# air_quality.date is UTC text, ts the same minute as a timestamptz.
+DATE_FORMAT = "%Y/%m/%d %H:%M"
+
+READINGS_QUERY = """
+INSERT INTO air_quality (sensor_id, pm25, humidity, temp_celsius, date, ts)
+VALUES %s
+ON CONFLICT (sensor_id, ts) DO NOTHING;
+"""
+
+SENSORS_QUERY = """
+INSERT INTO sensors (sensor_id, nombre, municipio, lat, lon)
+VALUES %s
+ON CONFLICT (sensor_id) DO UPDATE SET
+    nombre = EXCLUDED.nombre,
+    municipio = EXCLUDED.municipio,
+    lat = EXCLUDED.lat,
+    lon = EXCLUDED.lon;
+"""
+
+
+def reading_rows(readings):
+    rows = []
+    for reading in readings:
+        # Stored to the minute, like the rest of air_quality.
+        fecha = reading.fecha.replace(second=0, microsecond=0)
+        rows.append((reading.sensor_id, reading.pm25, reading.humidity, reading.temp_celsius,
+                     fecha.strftime(DATE_FORMAT), fecha))
+    return rows
+
+
+def _write(conn, query, rows):
+    if not rows:
+        return 0
+    with conn.cursor() as cursor:
+        # One page, so the whole batch is a single statement.
+        execute_values(cursor, query, rows, page_size=len(rows))
+        written = cursor.rowcount
+    conn.commit()
+    return written
+
+
+def write_readings(conn, readings):
+    """Store readings in one round trip. Returns how many were new."""
+    return _write(conn, READINGS_QUERY, reading_rows(readings))
+
+
+def write_sensors(conn, rows):
+    """Insert or update (sensor_id, nombre, municipio, lat, lon) rows in one statement."""
+    return _write(conn, SENSORS_QUERY, list(rows))
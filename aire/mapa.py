@@ -0,0 +1,235 @@
+"""The sensors map.
+
+Traces are built in one pass: the sensors are sorted once by category and
+each trace takes a slice of the same lat/lon/customdata arrays, instead of
+masking the frame once per category. Three views:
+
+    mapa.map_figure(summary, sensors)                  # points or clusters, by size
+    mapa.map_figure(summary, sensors, modo='densidad') # a PM2.5-weighted heatmap
+    mapa.animation(hourly, sensors, desde)             # NowCast per hour, time slider
+
+sensors is the snapshot's sensor registry frame (see aire.sensores), which
+holds the coordinates.
+
+MAP_MODE sets the points view: 'puntos', 'clusters', or 'auto', which
+clusters once there are MAP_CLUSTER_MIN_SENSORS sensors on the map.
+Clustering needs plotly 5.11 or newer. The figures are cached per snapshot
+version by the page (see aire.figcache).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from aire import aqi
+
+# 'auto', 'puntos' or 'clusters'.
+MAP_MODE = os.environ.get('MAP_MODE', 'auto')
+
+MAP_CLUSTER_MIN_SENSORS = int(os.environ.get('MAP_CLUSTER_MIN_SENSORS', 500))
+
+# Hours shown by the animation, counted back from the window's end.
+MAP_ANIMATION_HOURS = int(os.environ.get('MAP_ANIMATION_HOURS', 72))
+
+# Mapbox token
+MAPBOX_TOKEN = os.environ.get('DB_PWD_TER')
+
+CENTER = dict(lat=25.685387622008598, lon=-100.31385813323436)
+
+HOVER = "<br>".join([
+    "<b>Sensor</b>: %{customdata[0]}",
+    "<b>Municipio:</b> %{customdata[1]}",
+    "<b>Temperatura:</b> %{customdata[3]}°C",
+    "<b>PM2.5:</b> %{customdata[2]}",
+    "<b>PM2.5 actual:</b> %{customdata[4]}",
+    "<b>Calidad actual:</b> %{customdata[5]}",
+])
+
+HOVER_HORA = "<br>".join([
+    "<b>Sensor</b>: %{customdata[0]}",
+    "<b>Municipio:</b> %{customdata[1]}",
+    "<b>PM2.5 (NowCast):</b> %{customdata[2]}",
+])
+
+#----------
+# Sensors
+
+def located(frame, sensors, columns=('lat', 'lon')):
+    """frame with the sensors' columns; sensors without coordinates can't be placed."""
+    frame = frame.join(sensors[list(columns)], on='sensor_id', how='inner')
+    return frame[frame['lat'].notna() & frame['lon'].notna()]
+
+#----------
+# Traces
+
+def marker_traces(frame, values, customdata, table, hovertemplate, cluster=False, keep_empty=False):
+    """One Scattermapbox trace per category of table.
+
+    Missing values are left out. keep_empty adds a trace for categories
+    without sensors too, so animation frames always line up trace by trace.
+    """
+    codes = table.codes(values)
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    lat = frame['lat'].to_numpy()[order]
+    lon = frame['lon'].to_numpy()[order]
+    customdata = customdata[order]
+    bounds = np.searchsorted(codes, np.arange(len(table.categories) + 1), side='left')
+    traces = []
+    for code, (label, _, color, _, _) in enumerate(table.categories):
+        start, stop = bounds[code], bounds[code + 1]
+        if start == stop and not keep_empty:
+            continue
+        trace = dict(
+            lat=lat[start:stop],
+            lon=lon[start:stop],
+            customdata=customdata[start:stop],
+            mode='markers',
+            marker=dict(size=14, color=color),
+            hovertemplate=hovertemplate,
+            name=label,
+        )
+        if cluster:
+            trace['cluster'] = dict(enabled=True, color=color, maxzoom=12)
+        traces.append(go.Scattermapbox(**trace))
+    return traces
+
+
+def density_trace(frame, values, customdata, table, hovertemplate):
+    """A Densitymapbox weighted by concentration, on table's colors."""
+    top = table.edges[-1]
+    colorscale = [[0.0, table.categories[0][2]]]
+    colorscale += [[min(edge / top, 1.0), category[2]] for edge, category in zip(table.edges, table.categories[1:])]
+    return go.Densitymapbox(
+        lat=frame['lat'],
+        lon=frame['lon'],
+        z=values,
+        zmin=0,
+        zmax=top,
+        radius=25,
+        colorscale=colorscale,
+        showscale=False,
+        customdata=customdata,
+        hovertemplate=hovertemplate,
+    )
+
+
+def _layout(figure):
+    figure.update_layout(
+        mapbox=dict(
+            accesstoken=MAPBOX_TOKEN,
+            style="light",
+            zoom=10,
+            center=CENTER
+        ),
+        height=500,
+        margin={'l': 0, 'r': 0, 'b': 0, 't': 0},
+        modebar=dict(remove=["zoom", "toimage", "pan", "select", "lasso", "zoomin", "zoomout", "autoscale", "reset", "resetscale", "resetview"]),
+        showlegend=True,
+        legend=dict(
+            x=.98,
+            y=.98,
+            traceorder="normal",
+            font=dict(
+                family="sans-serif",
+                size=14,
+                color="black"
+            ),
+            xanchor='right',
+            yanchor='top'
+        )
+    )
+    return figure
+
+#----------
+# Figures
+
+def map_figure(summary, sensors, modo=None, table=aqi.NOM_172):
+    """Window averages per sensor, colored by category.
+
+    summary is a window summary (see SnapshotManager.window_summary). modo is
+    'puntos', 'clusters', 'densidad' or 'auto'; the default is MAP_MODE.
+    """
+    modo = modo or MAP_MODE
+    frame = located(summary, sensors)
+    values = frame['avg_pm25'].to_numpy(dtype=float)
+    customdata = frame[['nombre', 'municipio', 'avg_pm25', 'avg_temp_celsius', 'pm25_nowcast', 'calidad_actual']].to_numpy(dtype=object)
+    if modo == 'densidad':
+        present = ~np.isnan(values)
+        traces = [density_trace(frame[present], values[present], customdata[present], table, HOVER)]
+    else:
+        if modo == 'auto':
+            modo = 'clusters' if len(frame) >= MAP_CLUSTER_MIN_SENSORS else 'puntos'
+        traces = marker_traces(frame, values, customdata, table, HOVER, cluster=modo == 'clusters')
+    return _layout(go.Figure(data=traces))
+
+
+def animation(hourly, sensors, desde, hasta=None, municipio=None, table=None, hours=MAP_ANIMATION_HOURS):
+    """Hourly NowCast per sensor over the last hours of a window, with a time slider.
+
+    Every frame has one trace per category of table (AQI_STANDARD by
+    default); the figure opens on the latest hour.
+    """
+    table = table or aqi.TABLES[aqi.AQI_STANDARD]
+    figure = go.Figure()
+    if not len(hourly):
+        return _layout(figure)
+    end = pd.Timestamp(hasta) if hasta is not None else pd.Timestamp(hourly.buckets[-1]) + pd.Timedelta(hours=1)
+    start = max(pd.Timestamp(desde), end - pd.Timedelta(hours=hours))
+    # Loaded from NOWCAST_HOURS earlier, so the first frames see a full window.
+    history = aqi.history(hourly, start - pd.Timedelta(hours=aqi.NOWCAST_HOURS - 1), end, table)
+    history = history[(history['bucket'] >= start) & history['pm25_nowcast'].notna()]
+    history = located(history, sensors, ('nombre', 'municipio', 'lat', 'lon'))
+    if municipio:
+        history = history[history['municipio'] == municipio]
+    history = history.sort_values('bucket', kind='mergesort')
+    values = history['pm25_nowcast'].round(1).to_numpy(dtype=float)
+    customdata = np.column_stack([
+        history['nombre'].to_numpy(dtype=object),
+        history['municipio'].to_numpy(dtype=object),
+        values,
+    ])
+
+    # Sorted by hour, so each hour is one slice.
+    buckets = history['bucket'].to_numpy()
+    horas = np.unique(buckets)
+    bounds = np.searchsorted(buckets, horas, side='left').tolist() + [len(buckets)]
+    frames = []
+    for hora, first, last in zip(horas, bounds[:-1], bounds[1:]):
+        rows = slice(first, last)
+        traces = marker_traces(history.iloc[rows], values[rows], customdata[rows], table, HOVER_HORA, keep_empty=True)
+        frames.append(go.Frame(data=traces, name=pd.Timestamp(hora).strftime("%Y-%m-%d %H:%M")))
+    if not frames:
+        return _layout(figure)
+
+    figure = go.Figure(data=frames[-1].data, frames=frames)
+    steps = [
+        dict(
+            method='animate',
+            label=frame.name[5:],
+            args=[[frame.name], dict(mode='immediate', frame=dict(duration=0, redraw=True), transition=dict(duration=0))],
+        )
+        for frame in frames
+    ]
+    figure.update_layout(
+        sliders=[dict(active=len(frames) - 1, steps=steps, currentvalue=dict(prefix="Hora: "), pad=dict(t=10))],
+        updatemenus=[dict(
+            type='buttons',
+            direction='left',
+            x=0.02,
+            y=0.02,
+            xanchor='left',
+            yanchor='bottom',
+            buttons=[
+                dict(label="▶", method='animate',
+                     args=[None, dict(frame=dict(duration=500, redraw=True), fromcurrent=True, transition=dict(duration=0))]),
+                dict(label="❚❚", method='animate',
+                     args=[[None], dict(mode='immediate', frame=dict(duration=0, redraw=False), transition=dict(duration=0))]),
+            ],
+        )],
+    )
+    _layout(figure)
+    # Room for the slider below the map.
+    figure.update_layout(height=580, margin={'l': 0, 'r': 0, 'b': 60, 't': 0})
+    return figure
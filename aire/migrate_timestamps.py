@@ -0,0 +1,218 @@
+"""Add a native timestamptz column to air_quality and index it.
+
+air_quality.date is TEXT ('YYYY/MM/DD HH24:MI', UTC), so every query parses
+it with TO_TIMESTAMP and no index applies. This tool adds air_quality.ts,
+keeps it filled for new rows with a trigger, backfills existing rows in short
+batches and builds the (sensor_id, ts) and (ts) indexes without blocking
+writes. Run every step, with a timing report before and after:
+
+    python -m aire.migrate_timestamps
+
+or a single step with --step (add-column, backfill, index, report). Every
+step is idempotent, so an interrupted run can simply be started again.
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from aire import db
+
+log = logging.getLogger(__name__)
+
+# Rows updated per backfill transaction; small enough to keep locks short.
+BATCH_SIZE = 20000
+
+STEPS = ['add-column', 'backfill', 'index', 'report']
+
+#----------
+# Steps
+
+# Parses the stored UTC text; the same expression the dashboard queries used.
+TS_EXPRESSION = "TO_TIMESTAMP({column}, 'YYYY/MM/DD HH24:MI')::timestamp AT TIME ZONE 'UTC'"
+
+ADD_COLUMN = """
+SET lock_timeout = '5s';
+ALTER TABLE air_quality ADD COLUMN IF NOT EXISTS ts TIMESTAMPTZ;
+
+CREATE OR REPLACE FUNCTION air_quality_set_ts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' OR NEW.ts IS NULL THEN
+        NEW.ts := {expression};
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS air_quality_set_ts ON air_quality;
+CREATE TRIGGER air_quality_set_ts
+    BEFORE INSERT OR UPDATE OF date ON air_quality
+    FOR EACH ROW EXECUTE PROCEDURE air_quality_set_ts();
+""".format(expression=TS_EXPRESSION.format(column="NEW.date"))
+
+BACKFILL = """
+UPDATE air_quality
+SET ts = {expression}
+WHERE pollution_id > %(desde)s AND pollution_id <= %(hasta)s AND ts IS NULL;
+""".format(expression=TS_EXPRESSION.format(column="date"))
+
+# A NOT VALID check validated separately takes no exclusive lock while it
+# scans, and lets Postgres 12+ set NOT NULL without scanning again.
+NOT_NULL = [
+    "ALTER TABLE air_quality DROP CONSTRAINT IF EXISTS air_quality_ts_not_null",
+    "ALTER TABLE air_quality ADD CONSTRAINT air_quality_ts_not_null CHECK (ts IS NOT NULL) NOT VALID",
+    "ALTER TABLE air_quality VALIDATE CONSTRAINT air_quality_ts_not_null",
+    "ALTER TABLE air_quality ALTER COLUMN ts SET NOT NULL",
+]
+
+INDEXES = {
+    'air_quality_sensor_id_ts_idx': "CREATE INDEX CONCURRENTLY IF NOT EXISTS air_quality_sensor_id_ts_idx ON air_quality (sensor_id, ts)",
+    'air_quality_ts_idx': "CREATE INDEX CONCURRENTLY IF NOT EXISTS air_quality_ts_idx ON air_quality (ts)",
+}
+
+# An interrupted concurrent build leaves an INVALID index that IF NOT EXISTS
+# would skip forever.
+INVALID_INDEX = "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid"
+
+
+def add_column(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(ADD_COLUMN)
+    conn.commit()
+    log.info("Added air_quality.ts and its insert trigger")
+
+
+def backfill(conn, batch_size=BATCH_SIZE, pause=0.0):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MIN(pollution_id), 0), COALESCE(MAX(pollution_id), 0) FROM air_quality WHERE ts IS NULL")
+        first, last = cursor.fetchone()
+    conn.commit()
+
+    updated = 0
+    desde = first - 1
+    while desde < last:
+        hasta = desde + batch_size
+        with conn.cursor() as cursor:
+            cursor.execute(BACKFILL, {'desde': desde, 'hasta': hasta})
+            updated += cursor.rowcount
+        conn.commit()
+        log.info("Backfilled ts up to pollution_id %s (%s rows)", min(hasta, last), updated)
+        desde = hasta
+        if pause:
+            time.sleep(pause)
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in NOT_NULL:
+                cursor.execute(statement)
+    finally:
+        conn.autocommit = False
+    log.info("air_quality.ts is NOT NULL")
+
+
+def create_indexes(conn):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for name, statement in INDEXES.items():
+                cursor.execute(INVALID_INDEX, (name,))
+                if cursor.fetchone():
+                    log.info("Dropping invalid index %s", name)
+                    cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+                start = time.perf_counter()
+                cursor.execute(statement)
+                log.info("%s (%.1fs)", statement, time.perf_counter() - start)
+    finally:
+        conn.autocommit = False
+
+#----------
+# Timing report
+
+# Representative dashboard queries, written against the text column and
+# against ts.
+REPORT_QUERIES = {
+    'one sensor, last 7 days': (
+        "SELECT * FROM air_quality a WHERE a.sensor_id = %(sensor_id)s "
+        "AND TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI') >= %(desde)s",
+        "SELECT * FROM air_quality a WHERE a.sensor_id = %(sensor_id)s AND a.ts >= %(desde)s",
+    ),
+    'all sensors, last 24 hours': (
+        "SELECT * FROM air_quality a WHERE TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI') >= %(desde_24h)s",
+        "SELECT * FROM air_quality a WHERE a.ts >= %(desde_24h)s",
+    ),
+    'daily average per sensor, last 7 days': (
+        "SELECT sensor_id, date_trunc('day', TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI')), AVG(pm25) "
+        "FROM air_quality a WHERE TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI') >= %(desde)s GROUP BY 1, 2",
+        "SELECT sensor_id, date_trunc('day', a.ts), AVG(pm25) "
+        "FROM air_quality a WHERE a.ts >= %(desde)s GROUP BY 1, 2",
+    ),
+}
+
+
+def _execution_ms(cursor, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Execution Time']
+
+
+def report(conn):
+    """Print execution times of the text-based and ts-based query forms."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sensor_id FROM air_quality ORDER BY pollution_id DESC LIMIT 1")
+        row = cursor.fetchone()
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = 'air_quality' AND column_name = 'ts'"
+        )
+        has_ts = cursor.fetchone() is not None
+        now = datetime.now(timezone.utc)
+        params = {
+            'sensor_id': row[0] if row else 0,
+            'desde': now - timedelta(days=7),
+            'desde_24h': now - timedelta(hours=24),
+        }
+        print(f"{'query':<40} {'text (ms)':>12} {'ts (ms)':>12}")
+        for name, (before, after) in REPORT_QUERIES.items():
+            before_ms = _execution_ms(cursor, before, params)
+            after_ms = _execution_ms(cursor, after, params) if has_ts else float('nan')
+            print(f"{name:<40} {before_ms:>12.1f} {after_ms:>12.1f}")
+    conn.rollback()
+
+#----------
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate air_quality.date to a timestamptz column.")
+    parser.add_argument('--step', choices=STEPS, action='append',
+                        help="run only this step (repeatable); default: all of them")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0,
+                        help="seconds to sleep between backfill batches")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    steps = args.step or STEPS
+    conn = db.connect()
+    try:
+        if args.step is None:
+            print("Before:")
+            report(conn)
+        if 'add-column' in steps:
+            add_column(conn)
+        if 'backfill' in steps:
+            backfill(conn, batch_size=args.batch_size, pause=args.pause)
+        if 'index' in steps:
+            create_indexes(conn)
+        if 'report' in steps:
+            print("After:")
+            report(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure the home page's initial layout payload.
+
+Builds the page layout the way Dash serves it and prints its JSON size,
+gzipped size and the time spent building and serializing it:
+
+    python -m aire.payload
+
+Run it from the repository root before and after a layout change. The
+figures and grids are loaded by callbacks after the shell renders, so they
+aren't part of this payload.
+"""
+import argparse
+import gzip
+import importlib
+import json
+import time
+
+import plotly
+
+
+def measure(layout_function, repeat=5):
+    builds, serializations = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layout = layout_function()
+        built = time.perf_counter()
+        payload = json.dumps(layout, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+        builds.append(built - start)
+        serializations.append(time.perf_counter() - built)
+    return {
+        'bytes': len(payload),
+        'gzip_bytes': len(gzip.compress(payload)),
+        'first_build_ms': round(builds[0] * 1000, 1),
+        'build_ms': round(min(builds) * 1000, 1),
+        'serialize_ms': round(min(serializations) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the home page's layout payload.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import dash
+    # Importing the app registers the pages.
+    importlib.import_module('app')
+
+    report = measure(dash.page_registry['pages.home']['layout'], repeat=args.repeat)
+    for name, value in report.items():
+        print(f"{name:<16} {value:>12}")
+
+
+if __name__ == '__main__':
+    main()
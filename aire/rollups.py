@@ -0,0 +1,220 @@
+"""Hourly and daily per-sensor aggregates of air_quality.
+
+Each rollup row keeps the sum, count, min, max and last value of every
+measurement for one sensor and one local (Monterrey) hour or day. Rows are
+maintained incrementally: new readings are found through the pollution_id
+watermark in rollup_state and merged into existing buckets with an upsert,
+so the raw table is never rescanned.
+
+Create the tables and backfill them with:
+
+    python -m aire.rollups
+
+and keep them current by running it with --interval (or by calling update()
+after each ingestion cycle). The dashboard stays exact while they lag, it just
+reads more raw rows. After readings are deleted from air_quality, start over
+from an empty rollup with --rebuild.
+"""
+import argparse
+import logging
+import time
+
+from aire import data, db
+
+log = logging.getLogger(__name__)
+
+# Rollup tables by the date_trunc unit they're bucketed on.
+TABLES = {
+    'hour': 'air_quality_hourly',
+    'day': 'air_quality_daily',
+}
+
+# rollup_state key for the air_quality watermark.
+STATE_NAME = 'air_quality'
+
+# Readings merged per transaction.
+BATCH_SIZE = 50000
+
+# Advisory lock key so only one process updates the rollups at a time.
+LOCK_KEY = 'air_quality_rollups'
+
+#----------
+# Schema
+
+def _measurement_columns():
+    columns = []
+    for column in data.MEASUREMENTS:
+        columns += [
+            f"{column}_sum DOUBLE PRECISION NOT NULL DEFAULT 0",
+            f"{column}_count INTEGER NOT NULL DEFAULT 0",
+            f"{column}_min DOUBLE PRECISION",
+            f"{column}_max DOUBLE PRECISION",
+            f"{column}_last DOUBLE PRECISION",
+        ]
+    return ",\n    ".join(columns)
+
+
+TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    sensor_id INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    n INTEGER NOT NULL,
+    {measurements},
+    last_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (sensor_id, bucket)
+);
+CREATE INDEX IF NOT EXISTS {table}_bucket_idx ON {table} (bucket);
+"""
+
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    last_pollution_id BIGINT NOT NULL
+);
+INSERT INTO rollup_state (name, last_pollution_id) VALUES (%(name)s, 0)
+ON CONFLICT (name) DO NOTHING;
+"""
+
+
+def create_tables(conn):
+    with conn.cursor() as cursor:
+        for table in TABLES.values():
+            cursor.execute(TABLE_DDL.format(table=table, measurements=_measurement_columns()))
+        cursor.execute(STATE_DDL, {'name': STATE_NAME})
+    conn.commit()
+
+#----------
+# Incremental merge
+
+# Local time of each reading, as shown on the dashboard.
+LOCAL_DATE = "(a.ts AT TIME ZONE 'America/Monterrey')"
+
+
+def _merge_query(unit, table):
+    aggregates, inserted, updates = [], [], []
+    for column in data.MEASUREMENTS:
+        aggregates += [
+            f"COALESCE(SUM({column}), 0) AS {column}_sum",
+            f"COUNT({column}) AS {column}_count",
+            f"MIN({column}) AS {column}_min",
+            f"MAX({column}) AS {column}_max",
+            f"(ARRAY_AGG({column} ORDER BY fecha DESC, pollution_id DESC))[1] AS {column}_last",
+        ]
+        inserted += [f"{column}_{stat}" for stat in ('sum', 'count', 'min', 'max', 'last')]
+        updates += [
+            f"{column}_sum = r.{column}_sum + EXCLUDED.{column}_sum",
+            f"{column}_count = r.{column}_count + EXCLUDED.{column}_count",
+            f"{column}_min = LEAST(r.{column}_min, EXCLUDED.{column}_min)",
+            f"{column}_max = GREATEST(r.{column}_max, EXCLUDED.{column}_max)",
+            f"{column}_last = CASE WHEN EXCLUDED.last_at >= r.last_at "
+            f"THEN EXCLUDED.{column}_last ELSE r.{column}_last END",
+        ]
+    return f"""
+WITH nuevas AS (
+    SELECT a.pollution_id, a.sensor_id, a.pm25, a.temp_celsius, a.humidity, {LOCAL_DATE} AS fecha
+    FROM air_quality a
+    WHERE a.pollution_id > %(desde)s AND a.pollution_id <= %(hasta)s
+)
+INSERT INTO {table} AS r (sensor_id, bucket, n, {", ".join(inserted)}, last_at)
+SELECT
+    sensor_id,
+    date_trunc('{unit}', fecha) AS bucket,
+    COUNT(*) AS n,
+    {", ".join(aggregates)},
+    MAX(fecha) AS last_at
+FROM nuevas
+GROUP BY sensor_id, date_trunc('{unit}', fecha)
+ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+    n = r.n + EXCLUDED.n,
+    {", ".join(updates)},
+    last_at = GREATEST(r.last_at, EXCLUDED.last_at);
+"""
+
+
+MERGE_QUERIES = {unit: _merge_query(unit, table) for unit, table in TABLES.items()}
+
+
+def update(conn, batch_size=BATCH_SIZE, wait=False):
+    """Merge readings newer than the watermark into every rollup table.
+
+    Each batch of pollution_ids is merged and the watermark advanced in one
+    transaction, so an interrupted update resumes where it stopped. If another
+    process holds the lock the call returns right away unless wait is set.
+    Returns the number of readings merged.
+    """
+    merged = 0
+    while True:
+        with conn.cursor() as cursor:
+            if wait:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (LOCK_KEY,))
+            else:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (LOCK_KEY,))
+                if not cursor.fetchone()[0]:
+                    conn.rollback()
+                    return merged
+            cursor.execute("SELECT last_pollution_id FROM rollup_state WHERE name = %s", (STATE_NAME,))
+            desde = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT MAX(pollution_id), COUNT(*) FROM ("
+                "SELECT pollution_id FROM air_quality WHERE pollution_id > %s "
+                "ORDER BY pollution_id LIMIT %s) batch",
+                (desde, batch_size),
+            )
+            hasta, count = cursor.fetchone()
+            if not count:
+                conn.rollback()
+                return merged
+            for query in MERGE_QUERIES.values():
+                cursor.execute(query, {'desde': desde, 'hasta': hasta})
+            cursor.execute(
+                "UPDATE rollup_state SET last_pollution_id = %s WHERE name = %s",
+                (hasta, STATE_NAME),
+            )
+        conn.commit()
+        merged += count
+        log.info("Merged readings %s-%s into rollups", desde + 1, hasta)
+
+
+def reset(conn):
+    """Empty every rollup table and rewind the watermark, under the lock.
+
+    Rollups only ever add readings, so this is the way to drop the ones
+    deleted from air_quality; the next update() merges everything again.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (LOCK_KEY,))
+        cursor.execute(f"TRUNCATE {', '.join(TABLES.values())}")
+        cursor.execute("UPDATE rollup_state SET last_pollution_id = 0 WHERE name = %s", (STATE_NAME,))
+    conn.commit()
+    log.info("Emptied the rollups")
+
+#----------
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and backfill the air_quality rollups.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--interval', type=float, default=0,
+                        help="keep running, merging new readings every INTERVAL seconds")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="empty the rollups first and merge every reading again")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    conn = db.connect()
+    try:
+        create_tables(conn)
+        if args.rebuild:
+            reset(conn)
+        while True:
+            merged = update(conn, batch_size=args.batch_size, wait=True)
+            log.info("Rollups up to date, %s readings merged", merged)
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
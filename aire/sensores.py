@@ -0,0 +1,159 @@
+"""The sensor registry: which sensors exist, with their names and coordinates.
+
+The sensors table says which sensors exist, what they're called and where
+they are; assets/sensores.csv seeds it (see python -m aire.ingest
+--load-sensors) and fills in coordinates the table lacks. Every consumer reads the same frame,
+indexed by sensor_id:
+
+    sensores.registry.get(conn)    # nombre, municipio, lat, lon
+    sensores.registry.ids(conn)
+
+It is loaded once per process and reloaded after SENSORS_RELOAD_SECONDS or
+as soon as sensores.csv changes on disk, so sensors added to or removed from
+the table or the file reach the fetcher, the snapshot and the map without a
+restart. Without conn the registry borrows a pooled connection to reload.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from aire import db
+
+log = logging.getLogger(__name__)
+
+# Seconds a loaded registry is trusted before the table is read again.
+SENSORS_RELOAD_SECONDS = float(os.environ.get('SENSORS_RELOAD_SECONDS', 300))
+
+SENSORES_CSV = os.environ.get(
+    'SENSORES_CSV',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'sensores.csv'),
+)
+
+SENSORS_QUERY = """
+SELECT sensor_id, nombre, municipio, lat, lon
+FROM sensors;
+"""
+
+COLUMNS = ['nombre', 'municipio', 'lat', 'lon']
+
+#----------
+# Sources
+
+def read_csv(path=SENSORES_CSV):
+    """sensores.csv indexed by sensor_id."""
+    sensores = pd.read_csv(path, encoding='utf-8-sig')
+    sensores = sensores.astype({'sensor_id': 'int32', 'lat': 'float32', 'lon': 'float32'})
+    return sensores.set_index('sensor_id')[COLUMNS]
+
+
+def read_table(conn):
+    sensors = db.read_frame(conn, SENSORS_QUERY).astype({'sensor_id': 'int32'})
+    return sensors.set_index('sensor_id')
+
+
+def combine(table, csv):
+    """The table's sensors, with the file's coordinates where the table has none."""
+    fallback = csv[['lat', 'lon']].reindex(table.index)
+    sensors = table.astype({'lat': 'float64', 'lon': 'float64'})
+    sensors[['lat', 'lon']] = sensors[['lat', 'lon']].fillna(fallback.astype('float64'))
+    sensors = sensors.sort_index()
+    return sensors.astype({'nombre': 'category', 'municipio': 'category', 'lat': 'float32', 'lon': 'float32'})
+
+
+def fingerprint(sensors):
+    """A short hash of a registry frame, the same in every process that loaded it."""
+    hashed = pd.util.hash_pandas_object(sensors, index=True).to_numpy()
+    return hashlib.sha1(hashed.tobytes()).hexdigest()[:8]
+
+#----------
+# Registry
+
+class Registry:
+
+    def __init__(self, path=SENSORES_CSV, interval=SENSORS_RELOAD_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.version = 0
+        self.last_error = None
+        self._sensors = None
+        self._loaded_at = None
+        self._csv_mtime = None
+        self._lock = threading.Lock()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _stale(self):
+        return (
+            self._sensors is None
+            or time.monotonic() - self._loaded_at > self.interval
+            or self._mtime() != self._csv_mtime
+        )
+
+    def _load(self, conn, mtime):
+        csv = read_csv(self.path) if mtime is not None else pd.DataFrame(columns=COLUMNS)
+        if conn is None:
+            with db.connection() as conn:
+                table = read_table(conn)
+        else:
+            table = read_table(conn)
+        return combine(table, csv)
+
+    def get(self, conn=None):
+        """The registry frame, reloaded first if stale.
+
+        A failed reload keeps serving the previous frame and isn't tried
+        again until the next interval or the next change to the file; only
+        the first load raises.
+        """
+        if not self._stale():
+            return self._sensors
+        with self._lock:
+            if self._stale():
+                mtime = self._mtime()
+                try:
+                    sensors = self._load(conn, mtime)
+                except Exception as error:
+                    if self._sensors is None:
+                        raise
+                    log.exception("Sensor registry reload failed")
+                    self.last_error = repr(error)
+                    # Count the attempt, so a broken file or table isn't read
+                    # again on every call.
+                    self._csv_mtime = mtime
+                    self._loaded_at = time.monotonic()
+                    return self._sensors
+                if self._sensors is None or not sensors.equals(self._sensors):
+                    if self._sensors is not None:
+                        added = sensors.index.difference(self._sensors.index)
+                        removed = self._sensors.index.difference(sensors.index)
+                        log.info("Sensor registry: %s added, %s removed", len(added), len(removed))
+                    self._sensors = sensors
+                    self.version += 1
+                self._csv_mtime = mtime
+                self._loaded_at = time.monotonic()
+                self.last_error = None
+            return self._sensors
+
+    def ids(self, conn=None):
+        return self.get(conn).index.tolist()
+
+    def status(self):
+        sensors = self._sensors
+        return {
+            'loaded': sensors is not None,
+            'version': self.version,
+            'sensors': len(sensors) if sensors is not None else 0,
+            'without_coordinates': int(sensors['lat'].isna().sum()) if sensors is not None else 0,
+            'last_error': self.last_error,
+        }
+
+
+registry = Registry()
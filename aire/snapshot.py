@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from aire import aqi, data, sensores
+
+log = logging.getLogger(__name__)
+
+# Seconds between background refreshes.
+REFRESH_SECONDS = float(os.environ.get('SNAPSHOT_REFRESH_SECONDS', 300))
+
+# Window summaries kept per worker.
+WINDOW_CACHE_SIZE = int(os.environ.get('WINDOW_CACHE_SIZE', 32))
+
+#----------
+# Snapshot
+
+@dataclass(frozen=True)
+class Snapshot:
+    """An immutable set of frames loaded together from the database.
+
+    Callbacks must treat the frames as read-only: the same objects are shared
+    by every request until the next refresh swaps in a new snapshot.
+    """
+    readings: data.ReadingsLog
+    totals: pd.DataFrame
+    summary: pd.DataFrame
+    hourly: data.HourlyStore
+    # Sensor metadata indexed by sensor_id; readings only carry the id.
+    sensors: pd.DataFrame
+    # '<newest pollution_id>-<sensors fingerprint>'; see SnapshotManager._load.
+    version: str
+    loaded_at: datetime
+    load_seconds: float
+
+    @property
+    def age(self):
+        return (datetime.now(timezone.utc) - self.loaded_at).total_seconds()
+
+
+#----------
+# Manager
+
+class SnapshotManager:
+    """Loads the snapshot on first use and keeps it fresh from a daemon thread.
+
+    Readers call :meth:`get` and always receive a complete snapshot; a refresh
+    passes the current snapshot to the loader, which builds the new frames on
+    the side, and publishes them with a single reference assignment.
+    """
+
+    def __init__(self, loader, interval=REFRESH_SECONDS):
+        self._loader = loader
+        self.interval = interval
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._windows = OrderedDict()
+        self._windows_lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self.last_attempt_at = None
+        self.last_error = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load()
+                snapshot = self._snapshot
+            self._start()
+        return snapshot
+
+    def refresh(self):
+        with self._load_lock:
+            self._snapshot = self._load()
+        return self._snapshot
+
+    def subscribe(self, listener):
+        """Call listener(snapshot) from the refresh thread for every new version.
+
+        The first call is for the snapshot loaded when the thread starts.
+        Listeners run one after another and delay the next refresh, never a
+        request.
+        """
+        self._listeners.append(listener)
+
+    def window_summary(self, desde, hasta=None, municipio=None, snapshot=None):
+        """Per-sensor averages for a local time window and, optionally, one municipio.
+
+        The snapshot's own summary covers the full history; other windows
+        are aggregated from its hourly store. Each sensor also gets its
+        current index as of the window's end (see aire.aqi.latest). Results
+        are cached by snapshot version, so a refresh with new readings
+        invalidates them. Pass the snapshot a caller already holds, so the
+        summary comes from the same version as the rest of its response.
+        """
+        snapshot = snapshot or self.get()
+        key = (snapshot.version, desde, hasta, municipio)
+        with self._windows_lock:
+            if key in self._windows:
+                self._windows.move_to_end(key)
+                return self._windows[key]
+        if desde == datetime.combine(data.START_DATE, datetime.min.time()) and hasta is None and not municipio:
+            summary = snapshot.summary
+        else:
+            summary = data.summarize(snapshot.hourly.totals(desde, hasta, municipio))
+        summary = summary.merge(aqi.latest(snapshot.hourly, hasta), on='sensor_id', how='left')
+        with self._windows_lock:
+            self._windows[key] = summary
+            while len(self._windows) > WINDOW_CACHE_SIZE:
+                self._windows.popitem(last=False)
+        return summary
+
+    def status(self):
+        snapshot = self._snapshot
+        status = {
+            'loaded': snapshot is not None,
+            'refresh_seconds': self.interval,
+            'last_attempt_at': self.last_attempt_at.isoformat() if self.last_attempt_at else None,
+            'last_error': self.last_error,
+        }
+        if snapshot is not None:
+            status.update({
+                'version': snapshot.version,
+                'loaded_at': snapshot.loaded_at.isoformat(),
+                'age_seconds': round(snapshot.age, 1),
+                'load_seconds': round(snapshot.load_seconds, 3),
+                # Two missed refreshes in a row means the loop is falling behind.
+                'stale': snapshot.age > 2 * self.interval,
+                'memory': data.memory_report(snapshot.readings, snapshot.sensors, snapshot.hourly),
+            })
+        return status
+
+    def _load(self):
+        self.last_attempt_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        try:
+            frames = self._loader(self._snapshot)
+        except Exception as error:
+            self.last_error = repr(error)
+            raise
+        self.last_error = None
+        snapshot = Snapshot(
+            **frames,
+            # The newest reading and the registry identify the data, so every
+            # worker that loaded the same rows and sensors reports the same
+            # version, and a renamed or moved sensor changes it too.
+            version=f"{frames['readings'].last_id}-{sensores.fingerprint(frames['sensors'])}",
+            loaded_at=datetime.now(timezone.utc),
+            load_seconds=time.perf_counter() - start,
+        )
+        log.info("Loaded snapshot %s in %.2fs", snapshot.version, snapshot.load_seconds)
+        return snapshot
+
+    def _start(self):
+        # Started lazily so that each gunicorn worker gets its own thread
+        # after forking.
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._load_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+                self._thread.start()
+
+    def _notify(self, snapshot):
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                log.exception("Snapshot listener %r failed", listener)
+
+    def _run(self):
+        version = self._snapshot.version
+        self._notify(self._snapshot)
+        while True:
+            time.sleep(self.interval)
+            try:
+                snapshot = self.refresh()
+            except Exception:
+                # Keep serving the previous snapshot; status() reports the error.
+                log.exception("Snapshot refresh failed")
+                continue
+            if snapshot.version != version:
+                version = snapshot.version
+                self._notify(snapshot)
+
+
+snapshots = SnapshotManager(data.load_frames)
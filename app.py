@@ -1,9 +1,11 @@
 import dash
-from dash import Dash, html, dcc, Input, Output, State
+from dash import Dash, html, Input, Output, State, ALL, MATCH, ClientsideFunction
 import plotly_express as px
-import os
-import pandas as pd
-import psycopg2
+from flask import jsonify
+
+from aire import db, export, sensores
+from aire.figcache import figures
+from aire.snapshot import snapshots
 
 #----------
 # Stylesheets
@@ -58,114 +60,74 @@ app.layout = html.Div(
 #----------
 # Data
 
-# Connect to database.
-DATABASE_URL = os.environ.get('DATABASE_URL')
-conn = psycopg2.connect(DATABASE_URL)
-
-# Execute the query and fetch data
-query = """
-WITH numbered_rows AS (
-    SELECT a.pollution_id, a.sensor_id, a.pm25, a.humidity, s.nombre, s.municipio,
-           (TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI') - INTERVAL '6 hours') as date
-    FROM air_quality a
-    JOIN sensors s ON a.sensor_id = s.sensor_id
-)
-SELECT pollution_id, TO_CHAR(date, 'YYYY/MM/DD HH24:MI') as date, nombre, municipio, sensor_id, pm25, humidity
-FROM numbered_rows
-WHERE date >= TIMESTAMP '2023-05-08 00:00:00'
-ORDER BY date;
-"""
+# Frames are loaded on first use and refreshed in the background.
+# Report the snapshot's age so monitoring can alert when refreshes fall behind.
+def snapshot_health():
+    return jsonify(snapshots.status())
 
-dataframe = pd.read_sql(query, conn)
+server.route("/health/snapshot")(snapshot_health)
 
-dataframe.rename(columns={"nombre": "sensor", "date": "fecha"}, inplace=True)
+# Database reachability and pool usage for this worker.
+def db_health():
+    return jsonify(db.database.health())
 
-# Close the connection
-conn.close()
+server.route("/health/db")(db_health)
 
-#----------
-# Conoce más - Desktop
-def conocemas(n, is_open):
-    if n:
-        return not is_open
-    return is_open
+# Hit rate and size of the figure cache.
+def figures_health():
+    return jsonify(figures.status())
 
-app.callback(
-    Output("modal_conocemas", "is_open"),
-    [Input("open_conocemas", "n_clicks")],
-    [State("modal_conocemas", "is_open")],
-)(conocemas)
+server.route("/health/figuras")(figures_health)
 
-# Conoce más - Mobile
-def conocemas_m(n, is_open):
-    if n:
-        return not is_open
-    return is_open
+# Sensors known to this worker and when the registry last failed to reload.
+def sensors_health():
+    return jsonify(sensores.registry.status())
 
-app.callback(
-    Output("modal_conocemas_m", "is_open"),
-    [Input("open_conocemas_m", "n_clicks")],
-    [State("modal_conocemas_m", "is_open")],
-)(conocemas_m)
+server.route("/health/sensores")(sensors_health)
 
 #----------
-# Botón descargar - Desktop
-def descargar(n, is_open):
-    if n:
-        return not is_open
-    return is_open
-
-app.callback(
-    Output("modal_descargar", "is_open"),
-    [Input("open_descargar", "n_clicks")],
-    [State("modal_descargar", "is_open")],
-)(descargar)
-
-# Descargar - Mobile
-def descargar_m(n, is_open):
-    if n:
-        return not is_open
-    return is_open
-
-app.callback(
-    Output("modal_descargar_m", "is_open"),
-    [Input("open_descargar_m", "n_clicks")],
-    [State("modal_descargar_m", "is_open")],
-)(descargar_m)
+# Modals
+# Conoce más and Descargar open from the sidebar (desktop) and the navbar
+# (mobile). The toggle runs in the browser; see pages/home.py modal_id.
+app.clientside_callback(
+    ClientsideFunction(namespace="ui", function_name="toggle_modal"),
+    Output({"type": "modal", "name": MATCH}, "is_open"),
+    Input({"type": "abrir-modal", "name": MATCH, "lugar": ALL}, "n_clicks"),
+    State({"type": "modal", "name": MATCH}, "is_open"),
+    prevent_initial_call=True,
+)
 
 #----------
-# Descargar datos - Desktop
-def descargar_modal(n_clicks):
-    return dcc.send_data_frame(dataframe.to_csv, "calidadaire.csv", index = False)
-
-app.callback(
-    Output("datos", "data"),
-    Input("boton_descargar", "n_clicks"),
-    prevent_initial_call=True,
-)(descargar_modal)
+# Descargar datos
+# The download button links here. CSV is streamed in chunks so memory stays
+# flat regardless of history size or concurrent downloads; compressed formats
+# are cached per snapshot version.
+server.route(export.DOWNLOAD_PATH)(export.descargar)
 
-# Descargar datos - Mobile
-def descargar_modal_m(n_clicks):
-    return dcc.send_data_frame(dataframe.to_csv, "calidadaire.csv", index = False)
+def descargar_href(municipio, start_date, end_date, formato):
+    return export.download_url(municipio, start_date, end_date, formato)
 
 app.callback(
-    Output("datos_m", "data"),
-    Input("boton_descargar_m", "n_clicks"),
-    prevent_initial_call=True,
-)(descargar_modal_m)
+    Output("boton_descargar", "href"),
+    Input("municipio-dropdown", "value"),
+    Input("date-picker-range", "start_date"),
+    Input("date-picker-range", "end_date"),
+    Input("formato-descarga", "value"),
+)(descargar_href)
 
 #----------
 # Offcanvas - Mobile
-def toggle_offcanvas(n1, is_open):
-    if n1:
-        return not is_open
-    return is_open
-
-app.callback(
-    Output("offcanvas", "is_open"),
+# Below the xl breakpoint the sidebar is an offcanvas, opened from the navbar
+# and closed from its close button or the backdrop, in the browser.
+app.clientside_callback(
+    ClientsideFunction(namespace="ui", function_name="toggle_offcanvas"),
+    Output("sidebar", "className"),
     Input("open_offcanvas", "n_clicks"),
-    [State("offcanvas", "is_open")],
-)(toggle_offcanvas)
+    Input("cerrar_offcanvas", "n_clicks"),
+    Input("sidebar-backdrop", "n_clicks"),
+    State("sidebar", "className"),
+    prevent_initial_call=True,
+)
 
 #----------
 if __name__ == '__main__':
@@ -0,0 +1,25 @@
+// UI toggles that run in the browser, so opening a modal or the mobile
+// sidebar never reaches the server. Registered in app.py.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ui: {
+        // Every button of a modal (sidebar, navbar) toggles it.
+        toggle_modal: function(n_clicks, is_open) {
+            if (n_clicks.some(Boolean)) {
+                return !is_open;
+            }
+            return is_open;
+        },
+
+        // Below the xl breakpoint the sidebar is an offcanvas; "show" slides it in.
+        // The navbar's button opens it, its close button and the backdrop close it.
+        toggle_offcanvas: function(open_clicks, close_clicks, backdrop_clicks, className) {
+            var opened = dash_clientside.callback_context.triggered.some(function(trigger) {
+                return trigger.prop_id === "open_offcanvas.n_clicks";
+            });
+            var classes = className.split(" ").filter(function(name) {
+                return name && name !== "show";
+            });
+            return (opened ? classes.concat("show") : classes).join(" ");
+        }
+    }
+});
@@ -0,0 +1 @@
+# Makes the repository root importable (import aire) when running plain pytest.
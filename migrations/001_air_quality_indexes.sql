@@ -0,0 +1,13 @@
+-- Drops the indexes on the text date column that an earlier version of this
+-- migration created for filtered downloads. Since aire.migrate_timestamps
+-- added air_quality.ts nothing queries date, so they only slow down inserts.
+-- Databases that never ran the old version are left as they are.
+-- Run outside a transaction: DROP INDEX CONCURRENTLY doesn't block inserts.
+--
+--   psql "$DATABASE_URL" -f migrations/001_air_quality_indexes.sql
+
+DROP INDEX CONCURRENTLY IF EXISTS air_quality_date_idx;
+
+DROP INDEX CONCURRENTLY IF EXISTS air_quality_sensor_id_date_idx;
+
+DROP INDEX CONCURRENTLY IF EXISTS sensors_municipio_idx;
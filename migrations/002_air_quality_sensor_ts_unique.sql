@@ -0,0 +1,38 @@
+-- One reading per sensor and minute, so the ingestion can upsert on
+-- (sensor_id, ts) and a retried cycle never stores a reading twice.
+-- Needs air_quality.ts (aire.migrate_timestamps). Existing duplicates keep
+-- their first pollution_id. The unique index replaces the plain one on the
+-- same columns.
+--
+-- Until the unique index exists nothing stops a new duplicate, and one
+-- inserted after the DELETE makes the build fail. So:
+--
+--   1. stop the ingestion (python -m aire.ingest);
+--   2. run this file, outside a transaction:
+--        psql "$DATABASE_URL" -f migrations/002_air_quality_sensor_ts_unique.sql
+--   3. start the ingestion again;
+--   4. rebuild the rollups, which still count the deleted duplicates:
+--        python -m aire.rollups --rebuild
+--
+-- A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind that
+-- IF NOT EXISTS would then skip, so it is dropped first; running the file
+-- again after a failure finishes the job.
+
+\set ON_ERROR_STOP on
+
+DELETE FROM air_quality a
+USING air_quality b
+WHERE a.sensor_id = b.sensor_id
+  AND a.ts = b.ts
+  AND a.pollution_id > b.pollution_id;
+
+SELECT format('DROP INDEX CONCURRENTLY %s', indexrelid::regclass)
+FROM pg_index
+WHERE indexrelid = to_regclass('air_quality_sensor_id_ts_key')
+  AND NOT indisvalid
+\gexec
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS air_quality_sensor_id_ts_key
+    ON air_quality (sensor_id, ts);
+
+DROP INDEX CONCURRENTLY IF EXISTS air_quality_sensor_id_ts_idx;
@@ -1,16 +1,14 @@
 import dash
 import dash_bootstrap_components as dbc
-from dash import Dash, html, dcc
+from dash import html, dcc
 import dash_ag_grid as dag
-import pandas as pd
-import os
-import psycopg2
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, MATCH
 import plotly.express as px
-from datetime import datetime, date
-import plotly.graph_objects as go
-import numpy as np
-import pytz
+from datetime import datetime, date, timedelta
+
+from aire import aqi, data, export, grid, mapa
+from aire.figcache import figures
+from aire.snapshot import snapshots
 
 #----------
 dash.register_page(__name__, path="/")
@@ -18,43 +16,7 @@ dash.register_page(__name__, path="/")
 #----------
 # Data
 
-# Connect to database.
-DATABASE_URL = os.environ.get('DATABASE_URL')
-conn = psycopg2.connect(DATABASE_URL)
-
-# Execute the query and fetch data
-query = """
-WITH numbered_rows AS (
-    SELECT 
-        a.sensor_id, 
-        a.pm25, 
-        COALESCE(a.temp_celsius, 0) as temp_celsius,
-        a.humidity,
-        s.nombre, 
-        s.municipio, 
-        TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI') as date, 
-        ROW_NUMBER() OVER (ORDER BY TO_TIMESTAMP(a.date, 'YYYY/MM/DD HH24:MI')) as row_num
-    FROM air_quality a
-    JOIN sensors s ON a.sensor_id = s.sensor_id
-)
-SELECT 
-    sensor_id, 
-    nombre, 
-    municipio, 
-    ROUND(AVG(pm25)) as avg_pm25, 
-    ROUND(AVG(temp_celsius))::numeric(10,1) as avg_temp_celsius,
-    ROUND(AVG(humidity))::numeric(10,1) as avg_humidity
-FROM numbered_rows
-WHERE row_num > 714
-GROUP BY sensor_id, nombre, municipio
-ORDER BY MIN(date);
-"""
-
-dataframe = pd.read_sql(query, conn)
-dataframe.sort_values(by='avg_pm25', ascending=False, inplace=True) 
-
-# Close the connection
-conn.close()
+# Summary frames come from the shared snapshot, which refreshes in the background.
 
 #----------
 # Tabla
@@ -64,857 +26,680 @@ columnDefs = [
     {"headerName": "Municipio", "field": "municipio", "flex": 1},
     {"headerName": "Temperatura", "field": "avg_temp_celsius", "flex": 1, 'headerTooltip': 'Temperatura promedio en grados celsius de acuerdo a las mediciones realizadas cada hora.'},
     {"headerName": "Humedad", "field": "avg_humidity", "flex": 1, 'headerTooltip': 'Humedad relativa en el interior del sensor.'},
-    {"headerName": "PM2.5", "field": "avg_pm25", "flex": 1, 'headerTooltip': 'Promedio global de acuerdo a las mediciones realizadas cada hora.'},
-    {"headerName": "Calidad del Aire", "field": "color_label", "flex": 2}
+    {"headerName": "PM2.5", "field": "avg_pm25", "flex": 1, 'headerTooltip': 'Promedio en el rango de fechas seleccionado de acuerdo a las mediciones realizadas cada hora.'},
+    {"headerName": "Calidad del Aire", "field": "color_label", "flex": 2},
+    {"headerName": "PM2.5 actual", "field": "pm25_nowcast", "flex": 1, 'headerTooltip': 'Promedio ponderado (NowCast) de las últimas 12 horas al final del rango de fechas.'},
+    {"headerName": "Calidad actual", "field": "calidad_actual", "flex": 2, 'headerTooltip': f'Categoría según la {aqi.AQI_STANDARD}.'},
 ]
 
-def assign_color_label(value):
-    if value <= 25:
-        return "🟢 Buena"
-    elif 26 <= value <= 45:
-        return "🟡 Aceptable"
-    elif 46 <= value <= 79:
-        return "🟠 Mala"
-    elif 80 <= value <= 147:
-        return "🔴 Muy Mala"
-    else:
-        return "🟣 Extremadamente Mala"
-
-# Assign 'color_label' to the original dataframe
-dataframe['color_label'] = dataframe['avg_pm25'].apply(assign_color_label)
+# Scales without a numeric index, like NOM-172, only report categories.
+if aqi.TABLES[aqi.AQI_STANDARD].has_index:
+    columnDefs.insert(-1, {"headerName": "Índice", "field": "indice", "flex": 1, 'headerTooltip': f'Índice de calidad del aire {aqi.AQI_STANDARD}.'})
+
+def table_frame(dataframe):
+    # The snapshot's frame is shared, so label a copy.
+    dataframe = dataframe.copy()
+    dataframe['color_label'] = aqi.classify(dataframe['avg_pm25'])['color_label'].astype(str)
+    return dataframe
 
 #----------
-# Scatter Plot
+# Lecturas
 
-# Create a copy of the DataFrame for the scatter plot and sort it by 'municipio'
-scatter_dataframe = dataframe.copy()
-scatter_dataframe.sort_values(by='municipio', ascending=False, inplace=True)
-
-# Add Calidad del Aire column
-def calidad_aire(value):
-    if value <= 25:
-        return "Buena"
-    elif 26 <= value <= 45:
-        return "Aceptable"
-    elif 46 <= value <= 79:
-        return "Mala"
-    elif 80 <= value <= 147:
-        return "Muy Mala"
-    else:
-        return "Extremadamente Mala"
-
-scatter_dataframe['calidad_aire'] = scatter_dataframe['avg_pm25'].apply(calidad_aire)
-
-# Colors with transparency
-color_map = {
-    "Buena": "rgba(0,205,0,0.9)",    # green
-    "Aceptable": "rgba(255,215,0,0.9)",    # yellow
-    "Mala": "rgba(250,135,0,0.9)",    # orange
-    "Muy Mala": "rgba(235,0,0,0.9)",    # red
-    "Extremadamente Mala": "rgba(188,23,255,0.9)",    # purple
-}
+# Every reading in the window, paged from the server.
+lecturasColumnDefs = [
+    {"headerName": "Fecha", "field": "fecha", "flex": 1, "filter": "agDateColumnFilter"},
+    {"headerName": "Sensor", "field": "sensor", "flex": 1},
+    {"headerName": "Municipio", "field": "municipio", "flex": 1},
+    {"headerName": "PM2.5", "field": "pm25", "flex": 1, "filter": "agNumberColumnFilter"},
+    {"headerName": "Temperatura", "field": "temp_celsius", "flex": 1, "filter": "agNumberColumnFilter"},
+    {"headerName": "Humedad", "field": "humidity", "flex": 1, "filter": "agNumberColumnFilter"},
+]
 
-scatter_dataframe['sensor_count'] = range(1, len(scatter_dataframe) + 1)
-scatter_dataframe['municipio_order'] = scatter_dataframe.groupby('municipio').ngroup()
-
-scatter_dataframe.rename(columns={"avg_pm25": "PM2.5", "municipio": "Municipio"}, inplace=True)
-
-scatter_fig = px.scatter(
-    scatter_dataframe,
-    x="PM2.5",
-    y='Municipio',
-    title=None,
-    hover_name='nombre',
-    custom_data=["nombre", "calidad_aire", "avg_temp_celsius"], 
-)
-
-scatter_fig.update_traces(
-    hovertemplate="<br>".join([
-        "<b>Sensor:</b> %{customdata[0]}",
-        "<b>Municipio:</b> %{y}",
-        "<b>Temperatura:</b> %{customdata[2]}°C",
-        "<b>PM2.5:</b> %{x:.0f}",
-        "<b>Calidad del Aire:</b> %{customdata[1]}"
-    ]),
-    hoverinfo="none", 
-    marker=dict(
-        size=14, 
-        line=dict(
-            width=1,  
-            color='white' 
-        ),
-        color=scatter_dataframe['calidad_aire'].map(color_map)  
-    )
-)
-
-scatter_fig.update_layout(
-    xaxis_title= "",
-    yaxis_title=None,
-    showlegend=False,
-    height=500, 
-    margin=dict(l=20, r=20, t=20, b=0),
-    plot_bgcolor='rgb(240,240,239)', 
-    yaxis=dict(  
-        tickmode="array",
-        tickvals=scatter_dataframe["Municipio"],
-        ticktext=[str(label) + "   " for label in scatter_dataframe["Municipio"]],
-        tickfont=dict(size=14),
-        tickangle=0,
-        ticklen=10,
-        tickcolor='white',
-        automargin = True
-    ),
-    xaxis=dict(  
-        tickmode="auto",
-        side = "bottom",
-        tickfont=dict(size=14),
-        tickangle=0,
-        ticklen=10,
-        tickcolor='white',
-        ticklabelmode="period",
-        ticklabelposition="outside",
-        ticksuffix="   ",
-        tickvals=scatter_dataframe["PM2.5"],
-        ticktext=["   " + str(label) + "   " for label in scatter_dataframe["PM2.5"]],
-        dtick=1 
-    ),
-    annotations=[
-        dict(
-            x=0, 
-            y=-0.105,  
-            showarrow=False,
-            text="<b>PM2.5</b>",
-            xref="paper",
-            yref="paper",
-            font=dict(size=14),
-        )
-    ]
-)
+def lecturas_frame(snapshot, start, end, municipio=None):
+    sensor_ids = None
+    if municipio:
+        sensor_ids = snapshot.sensors.index[snapshot.sensors['municipio'] == municipio]
+    # Newest first until the user sorts. Sensor names are joined per block,
+    # see lecturas_lookups.
+    return snapshot.readings.window(start, end, sensor_ids).iloc[::-1]
+
+def lecturas_lookups(snapshot):
+    return {
+        "sensor": ("sensor_id", snapshot.sensors["nombre"]),
+        "municipio": ("sensor_id", snapshot.sensors["municipio"]),
+    }
 
 #----------
-# Mapa
+# Scatter Plot
+
+def scatter_data(dataframe):
+    # Create a copy of the DataFrame for the scatter plot and sort it by 'municipio'
+    scatter_dataframe = dataframe.copy()
+    scatter_dataframe.sort_values(by='municipio', ascending=False, inplace=True)
+
+    # Add Calidad del Aire column and its color
+    clasificacion = aqi.classify(scatter_dataframe['avg_pm25'])
+    scatter_dataframe['calidad_aire'] = clasificacion['calidad_aire'].astype(str)
+    scatter_dataframe['color'] = clasificacion['color'].astype(str)
+
+    scatter_dataframe['sensor_count'] = range(1, len(scatter_dataframe) + 1)
+    scatter_dataframe['municipio_order'] = scatter_dataframe.groupby('municipio').ngroup()
+
+    scatter_dataframe.rename(columns={"avg_pm25": "PM2.5", "municipio": "Municipio"}, inplace=True)
+    return scatter_dataframe
+
+def scatter_figure(scatter_dataframe):
+    scatter_fig = px.scatter(
+        scatter_dataframe,
+        x="PM2.5",
+        y='Municipio',
+        title=None,
+        hover_name='nombre',
+        custom_data=["nombre", "calidad_aire", "avg_temp_celsius", "pm25_nowcast", "calidad_actual"], 
+    )
 
-# Upload data.
-sensors_df = pd.read_csv("assets/sensores.csv")
-
-# Merge the dataframes on 'sensor_id'
-merged_df = sensors_df.merge(scatter_dataframe[['sensor_id', 'PM2.5', 'calidad_aire', 'avg_temp_celsius']], on='sensor_id', how='left')
-
-# Mapbox token
-token = os.environ['DB_PWD_TER']
-
-# Create a separate trace for each "Calidad del Aire" category
-traces = []
-for calidad in merged_df['calidad_aire'].unique():
-    df_sub = merged_df[merged_df['calidad_aire'] == calidad]
-    traces.append(
-        go.Scattermapbox(
-            lat=df_sub["lat"],
-            lon=df_sub["lon"],
-            customdata=np.stack((df_sub["nombre"], df_sub["municipio"], df_sub["PM2.5"], df_sub["avg_temp_celsius"]), axis=-1),            mode='markers',
-            marker=dict(
-                size=14,
-                color=color_map[calidad]
+    scatter_fig.update_traces(
+        hovertemplate="<br>".join([
+            "<b>Sensor:</b> %{customdata[0]}",
+            "<b>Municipio:</b> %{y}",
+            "<b>Temperatura:</b> %{customdata[2]}°C",
+            "<b>PM2.5:</b> %{x:.0f}",
+            "<b>Calidad del Aire:</b> %{customdata[1]}",
+            "<b>PM2.5 actual:</b> %{customdata[3]}",
+            "<b>Calidad actual:</b> %{customdata[4]}"
+        ]),
+        hoverinfo="none", 
+        marker=dict(
+            size=14, 
+            line=dict(
+                width=1,  
+                color='white' 
             ),
-            hovertemplate=
-                """<b>Sensor</b>: %{customdata[0]}
-                <br><b>Municipio:</b> %{customdata[1]}
-                <br><b>Temperatura:</b> %{customdata[3]}°C
-                <br><b>PM2.5:</b> %{customdata[2]}""",
-            name=calidad
+            color=scatter_dataframe['color']  
         )
     )
 
-# Convert your dataframe into the Graph Objects format
-sensors_go = go.Figure(data=traces)
-
-# Update layout
-sensors_go.update_layout(
-    mapbox=dict(
-        accesstoken=token,
-        style="light",
-        zoom=10,
-        center=dict(lat=25.685387622008598, lon=-100.31385813323436)
-    ),
-    height=500,
-    margin={'l': 0, 'r': 0, 'b': 0, 't': 0},
-    modebar=dict(remove=["zoom", "toimage", "pan", "select", "lasso", "zoomin", "zoomout", "autoscale", "reset", "resetscale", "resetview"]),
-    showlegend=True,
-    legend=dict(
-        x=.98,
-        y=.98,
-        traceorder="normal",
-        font=dict(
-            family="sans-serif",
-            size=14,
-            color="black"
+    scatter_fig.update_layout(
+        xaxis_title= "",
+        yaxis_title=None,
+        showlegend=False,
+        height=500, 
+        margin=dict(l=20, r=20, t=20, b=0),
+        plot_bgcolor='rgb(240,240,239)', 
+        yaxis=dict(  
+            tickmode="array",
+            tickvals=scatter_dataframe["Municipio"],
+            ticktext=[str(label) + "   " for label in scatter_dataframe["Municipio"]],
+            tickfont=dict(size=14),
+            tickangle=0,
+            ticklen=10,
+            tickcolor='white',
+            automargin = True
+        ),
+        xaxis=dict(  
+            tickmode="auto",
+            side = "bottom",
+            tickfont=dict(size=14),
+            tickangle=0,
+            ticklen=10,
+            tickcolor='white',
+            ticklabelmode="period",
+            ticklabelposition="outside",
+            ticksuffix="   ",
+            tickvals=scatter_dataframe["PM2.5"],
+            ticktext=["   " + str(label) + "   " for label in scatter_dataframe["PM2.5"]],
+            dtick=1 
         ),
-        xanchor='right', 
-        yanchor='top' 
+        annotations=[
+            dict(
+                x=0, 
+                y=-0.105,  
+                showarrow=False,
+                text="<b>PM2.5</b>",
+                xref="paper",
+                yref="paper",
+                font=dict(size=14),
+            )
+        ]
     )
-)
+    return scatter_fig
 
 #----------
-# Calendar date
+# Mapa
 
-# Create a timezone object for Mexico City
-mexico_tz = pytz.timezone('America/Mexico_City')
+# Vistas del mapa; see aire.mapa.
+vista_options = [
+    {"label": "Sensores", "value": "sensores"},
+    {"label": "Densidad", "value": "densidad"},
+    {"label": "Por hora", "value": "animacion"}
+]
 
-# Get the current date in Mexico City timezone
-now_mexico = datetime.now(mexico_tz)
+#----------
+# Municipio
+
+# Values match the spelling in the sensors table.
+municipio_options = [
+    {"label": "Zona Metropolitana", "value": "Zona Metropolitana"},
+    {"label": "Abasolo", "value": "Abasolo"},
+    {"label": "El Carmen", "value": "El Carmen"},
+    {"label": "Escobedo", "value": "Escobedo"},
+    {"label": "García", "value": "Garcia"},
+    {"label": "Juárez", "value": "Juárez"},
+    {"label": "Allende", "value": "Allende"},
+    {"label": "Apodaca", "value": "Apodaca"},
+    {"label": "Cadereyta Jimenez", "value": "Cadereyta Jimenez"},
+    {"label": "Cienega de Flores", "value": "Cienega de Flores"},
+    {"label": "Guadalupe", "value": "Guadalupe"},
+    {"label": "Monterrey", "value": "Monterrey"},
+    {"label": "Salinas Victoria", "value": "Salinas Victoria"},
+    {"label": "San Nicolás de los Garza", "value": "San Nicolas de los Garza"},
+    {"label": "San Pedro Garza García", "value": "San Pedro Garza Garcia"},
+    {"label": "Santa Catarina", "value": "Santa Catarina"},
+    {"label": "Santiago", "value": "Santiago"}
+]
+
+#----------
+# Descargar
+
+formato_options = [
+    {"label": "CSV", "value": "csv"},
+    {"label": "CSV comprimido", "value": "csv.gz"},
+    {"label": "Parquet", "value": "parquet"}
+]
+
+#----------
+# Ventana de tiempo
+
+def window_from_dates(start_date, end_date):
+    """Local [start, end) bounds for the date picker's inclusive range.
+
+    A range ending today (or open) runs up to the latest reading.
+    """
+    start = datetime.combine(date.fromisoformat((start_date or data.START_DATE.isoformat())[:10]), datetime.min.time())
+    end = None
+    if end_date and end_date[:10] < data.local_now().date().isoformat():
+        end = datetime.combine(date.fromisoformat(end_date[:10]), datetime.min.time()) + timedelta(days=1)
+    return start, end
+
+#----------
+# Tablas
+
+defaultColDef = {
+    'editable': False,
+    'sortable': True,
+    'filter': 'agTextColumnFilter',
+    'resizable': True
+}
+
+def grid_id(tabla, start, end=None, municipio=None):
+    # The window is part of the id: a new id mounts a new grid, which drops
+    # the blocks it has cached and asks for rows again.
+    return {
+        "type": tabla,
+        "desde": start.isoformat(),
+        "hasta": end.isoformat() if end else "",
+        "municipio": municipio or "",
+    }
+
+def infinite_grid(tabla, column_defs, start, end=None, municipio=None):
+    """A grid that fetches its rows block by block through filas()."""
+    return dag.AgGrid(
+        id=grid_id(tabla, start, end, municipio),
+        columnDefs=column_defs,
+        defaultColDef=defaultColDef,
+        rowModelType="infinite",
+    )
 
+def filas(request):
+    if request is None:
+        return dash.no_update
+    tabla = dash.ctx.triggered_id
+    start = datetime.fromisoformat(tabla["desde"])
+    end = datetime.fromisoformat(tabla["hasta"]) if tabla["hasta"] else None
+    municipio = tabla["municipio"] or None
+    snapshot = snapshots.get()
+
+    def build():
+        if tabla["type"] == "lecturas":
+            return lecturas_frame(snapshot, start, end, municipio)
+        return table_frame(snapshots.window_summary(start, end, municipio, snapshot))
+
+    lookups = lecturas_lookups(snapshot) if tabla["type"] == "lecturas" else None
+    view = grid.prepared((tabla["type"], snapshot.version, start, end, municipio), request, build, lookups)
+    return grid.rows(view, request)
+
+for nombre_tabla in ["tabla", "lecturas"]:
+    pattern = {"type": nombre_tabla, "desde": MATCH, "hasta": MATCH, "municipio": MATCH}
+    dash.callback(
+        Output(pattern, "getRowsResponse"),
+        Input(pattern, "getRowsRequest"),
+    )(filas)
+
+#----------
+# Resumen
+
+def ventana(start_date, end_date):
+    """Local window for the date picker's values.
+
+    While the picker still shows the configured window, that window is used
+    as is, since it may start mid-day; any other range covers whole days.
+    Only the values matter, not which input fired, so the map and the
+    summary always agree.
+    """
+    default_start, default_end = data.parse_window(data.SUMMARY_WINDOW)
+    start, end = window_from_dates(start_date, end_date)
+    if end is None and start == datetime.combine(default_start.date(), datetime.min.time()):
+        return default_start, default_end
+    return start, end
+
+def resumen(start, end, municipio=None):
+    """Scatter figure for a window.
+
+    Figures are cached by snapshot version and filters; see aire.figcache.
+    """
+    snapshot = snapshots.get()
+
+    def build():
+        dataframe = snapshots.window_summary(start, end, municipio, snapshot)
+        return scatter_figure(scatter_data(dataframe)).to_json()
+
+    return figures.get_or_build(("scatter", snapshot.version, start, end, municipio), build)
+
+def actualizar_resumen(municipio, start_date, end_date):
+    start, end = ventana(start_date, end_date)
+    if municipio == export.ALL_MUNICIPIOS:
+        municipio = None
+    return (
+        infinite_grid("tabla", columnDefs, start, end, municipio),
+        infinite_grid("lecturas", lecturasColumnDefs, start, end, municipio),
+        resumen(start, end, municipio),
+    )
+
+dash.callback(
+    Output("tabla", "children"),
+    Output("lecturas", "children"),
+    Output("scatter_plot", "figure"),
+    Input("municipio-dropdown", "value"),
+    Input("date-picker-range", "start_date"),
+    Input("date-picker-range", "end_date"),
+)(actualizar_resumen)
+
+def mapa_figure(start, end, municipio, vista):
+    """Map figure for a window and vista, cached like resumen's."""
+    snapshot = snapshots.get()
+
+    def build():
+        if vista == "animacion":
+            return mapa.animation(snapshot.hourly, snapshot.sensors, start, end, municipio).to_json()
+        modo = "densidad" if vista == "densidad" else None
+        return mapa.map_figure(snapshots.window_summary(start, end, municipio, snapshot), snapshot.sensors, modo).to_json()
+
+    return figures.get_or_build(("mapa", snapshot.version, start, end, municipio, vista), build)
+
+# Changing the vista rebuilds only the map.
+def actualizar_mapa(municipio, start_date, end_date, vista):
+    start, end = ventana(start_date, end_date)
+    if municipio == export.ALL_MUNICIPIOS:
+        municipio = None
+    return mapa_figure(start, end, municipio, vista)
+
+dash.callback(
+    Output("mapa", "figure"),
+    Input("municipio-dropdown", "value"),
+    Input("date-picker-range", "start_date"),
+    Input("date-picker-range", "end_date"),
+    Input("mapa-vista", "value"),
+)(actualizar_mapa)
 
 #----------
 # Page layout
-layout = html.Div([
 
-    # Sidebar y Visualizaciones - Desktop
-    dbc.Row([
+# Shown by the graphs until actualizar_resumen and actualizar_mapa fill them in.
+placeholder_figure = {
+    "layout": {
+        "height": 500,
+        "xaxis": {"visible": False},
+        "yaxis": {"visible": False},
+        "plot_bgcolor": "white",
+    }
+}
+
+# One tree serves every screen size: each control, figure and grid exists
+# once, and assets/styles.css lays it out. From the xl breakpoint up the
+# sidebar is fixed on the left; below it the sidebar becomes an offcanvas
+# opened from the bottom navbar and closed from its own button or the
+# backdrop.
+
+def card(children, className):
+    return dbc.Row(
+        dbc.Col(
+            dbc.Card(
+                dbc.CardBody(children)
+            )
+        ),
+        className = className
+    )
 
-        # Sidebar   
+def filtro(icono, altura, margen, titulo, tooltip_id, tooltip, control):
+    return dbc.Row(
         dbc.Col([
+            html.Div([
+                html.Img(src=f"assets/{icono}", height=altura, style={'margin-right': margen}),
+                html.Span(
+                    titulo, style = {"font-weight": "bold"}, id=tooltip_id
+                ), 
+                dbc.Tooltip(
+                    tooltip,
+                    target=tooltip_id,
+                    placement = "top"
+                )              
+            ],
+                style={'display': 'flex', 'align-items': 'center'}
+            ),
+            control
+        ]),
+        className = "pt-4 px-3"
+    )
+
+# Modals open and close in the browser (assets/clientside.js): any button
+# with abrir_id(name, ...) toggles the modal with modal_id(name), so a new
+# modal needs no callback of its own.
+def modal_id(name):
+    return {"type": "modal", "name": name}
+
+def abrir_id(name, lugar):
+    return {"type": "abrir-modal", "name": name, "lugar": lugar}
+
+def modal_conocemas():
+    return dbc.Modal([
+        dbc.ModalHeader(
+            dbc.ModalTitle("Conoce más")
+        ),
+        dbc.ModalBody([
+            html.P([
+                "Desarrollamos esta plataforma para fortalecer a la ciudadanía en la lucha por crear una ciudad "
+                "con mejor calidad de aire para todas y todos. El sistema actual recolecta cada " 
+                "hora datos de los más de 100 sensores de ",
+                html.A("Purple Air",
+                       href="https://www2.purpleair.com/",
+                       target="_blank",
+                       style={"text-decoration": "none"}),
+                " en el área metropolitana de Monterrey."
+            ]),
+            html.P([
+                "Si tienes dudas sobre el proyecto o te gustaría colaborar para fortalecer la plataforma "
+                "nos puedes enviar un correo a hola@datacomun.org o visitar nuestra página en ",
+                html.A(
+                    "datacomun.org",
+                    href="https://www.datacomun.org/",
+                    target="_blank",
+                    style={"text-decoration": "none"}
+                )
+            ])
+        ])
+    ],
+    id = modal_id("conocemas"),
+    is_open = False
+    )
+
+def modal_descargar():
+    return dbc.Modal([
+        dbc.ModalHeader(
+            dbc.ModalTitle("Descarga los datos")
+        ),
+        dbc.ModalBody([
+            html.P(
+                "Los datos se descargan de acuerdo a los filtros previamente seleccionados en formato CSV que puedes abrir " 
+                "en varias plataformas, incluyendo Excel. Para análisis también están disponibles en CSV comprimido y Parquet."
+            ),
+            dbc.RadioItems(
+                id="formato-descarga",
+                options=formato_options,
+                value="csv",
+                inline=True
+            )
+        ]),
+        dbc.ModalFooter([
+            dbc.Button(
+                "Descargar",
+                id="boton_descargar",
+                href=export.download_url(),
+                external_link=True,
+                color="secondary",
+                outline=True,
+                style={'border-color': '#CCCCCC'}
+            )
+        ])
+    ],
+    id = modal_id("descargar"),
+    is_open = False
+    )
+
+def navbar_button(icono, altura, button_id):
+    return dbc.Col(
+        html.Div(
+            html.Button(
+                html.Img(src=f"assets/{icono}", height=altura), 
+                id=button_id,
+                n_clicks=0,
+                style={
+                    "background": "none",
+                    "border": "none",
+                    "cursor": "pointer",
+                }
+            )
+        ),
+        className = "d-flex align-items-center justify-content-center"
+    )
+
+def layout():
+    """The page shell.
+
+    Only controls and placeholders are sent with the page, so it renders
+    without touching the data; the initial calls of actualizar_resumen and
+    actualizar_mapa then load the figures and grids inside dcc.Loading
+    regions.
+    """
+    window_start, window_end = data.parse_window(data.SUMMARY_WINDOW)
+
+    # Today in Monterrey, like the readings
+    now_local = data.local_now()
+
+    # Sidebar: fixed on desktop, offcanvas on mobile
+    sidebar = html.Div([
+        # Close button - Mobile
+        html.Div(
+            html.Button(id="cerrar_offcanvas", className="btn-close", **{"aria-label": "Cerrar"}),
+            className = "offcanvas-header justify-content-end d-xl-none"
+        ),
+        html.Div([
             # Website's logo
             dbc.Row(
                 dbc.Col(
-                    dbc.Row(
-                        dbc.Col(
-                            html.Img(src="../assets/logo_datacomun.png", height="24px"),
-                            style={"color": "black"}
-                        )
-                    )
+                    html.Img(src="../assets/logo_datacomun.png", height="24px"),
+                    style={"color": "black"}
                 ),
                 className = "pt-2 px-3 pb-4"
             ),
             # Fuente de datos
-            dbc.Row(
-                dbc.Col([
-                    html.Div([
-                        html.Img(src="assets/sensor.png", height="22px", style={'margin-right': '6px'}),
-                        html.Span(
-                            "Fuente", style = {"font-weight": "bold"}, id="fuente-tooltip-target"
-                        ), 
-                        dbc.Tooltip(
-                            "Solo una fuente de datos disponible por el momento.",
-                            target="fuente-tooltip-target",
-                            placement = "top"
-                        )              
+            filtro(
+                "sensor.png", "22px", "6px", "Fuente", "fuente-tooltip-target",
+                "Solo una fuente de datos disponible por el momento.",
+                dcc.Dropdown(
+                    id='fuente-dropdown',
+                    options=[
+                        {"label": "Sensores de Purple Air", "value": "Sensores de Purple Air"},
+                        {"label": "🔒🔜 Sensores del Estado de N.L.", "value": "Sensores del Estado de Nuevo León", "disabled": True}
                     ],
-                        style={'display': 'flex', 'align-items': 'center'}
-                    ),
-                    dcc.Dropdown(
-                        id='municipio-dropdown-d',
-                        options=[
-                            {"label": "Sensores de Purple Air", "value": "Sensores de Purple Air"},
-                            {"label": "🔒🔜 Sensores del Estado de N.L.", "value": "Sensores del Estado de Nuevo León", "disabled": True}
-                        ],
-                        value='Sensores de Purple Air',
-                        clearable=False,
-                        style={'backgroundColor': '#FFFFFF'},
-                        className = "pt-3"
-                    )
-                ]),
-                className = "pt-4 px-3"
+                    value='Sensores de Purple Air',
+                    clearable=False,
+                    style={'backgroundColor': '#FFFFFF'},
+                    className = "pt-3"
+                )
             ),
             # Indicador
-            dbc.Row(
-                dbc.Col([
-                    html.Div([
-                        html.Img(src="assets/indicador.png", height="20px", style={'margin-right': '8px'}),
-                        html.Span(
-                            "Indicador", style = {"font-weight": "bold"}, id="indicador-tooltip-target"
-                        ), 
-                        dbc.Tooltip(
-                            "Solo un indicador disponible por el momento.",
-                            target="indicador-tooltip-target",
-                            placement = "top"
-                        )              
+            filtro(
+                "indicador.png", "20px", "8px", "Indicador", "indicador-tooltip-target",
+                "Solo un indicador disponible por el momento.",
+                dcc.Dropdown(
+                    id='indicador-dropdown',
+                    options=[
+                        {"label": "PM2.5", "value": "PM2.5"},
+                        {"label": "🔒🔜 PM10.0", "value": "PM10.0", "disabled": True},
+                        {"label": "🔒🔜 Temperatura", "value": "Temperatura", "disabled": True}
                     ],
-                        style={'display': 'flex', 'align-items': 'center'}
-                    ),
-                    dcc.Dropdown(
-                        id='mes-dropdown-d',
-                        options=[
-                            {"label": "PM2.5", "value": "PM2.5"},
-                            {"label": "🔒🔜 PM10.0", "value": "PM10.0", "disabled": True},
-                            {"label": "🔒🔜 Temperatura", "value": "Temperatura", "disabled": True}
-                        ],
-                        value='PM2.5',
-                        clearable=False,
-                        style={'backgroundColor': '#FFFFFF'},
-                        className = "pt-3"
-                    )
-                ]),
-                className = "pt-4 px-3"
+                    value='PM2.5',
+                    clearable=False,
+                    style={'backgroundColor': '#FFFFFF'},
+                    className = "pt-3"
+                )
             ),
             # Municipio
-            dbc.Row(
-                dbc.Col([
-                    html.Div([
-                        html.Img(src="assets/location.png", height="20px", style={'margin-right': '8px'}),
-                        html.Span(
-                            "Municipio", style = {"font-weight": "bold"}, id="municipio-tooltip-target"
-                        ), 
-                        dbc.Tooltip(
-                            "Solo una opción disponible por el momento.",
-                            target="municipio-tooltip-target",
-                            placement = "top"
-                        )              
-                    ],
-                        style={'display': 'flex', 'align-items': 'center'}
-                    ),
-                    dcc.Dropdown(
-                        id='mes-dropdown-d',
-                        options=[
-                            {"label": "Zona Metropolitana", "value": "Zona Metropolitana"},
-                            {"label": "🔒🔜 Abasolo", "value": "Abasolo", "disabled": True},
-                            {"label": "🔒🔜 El Carmen", "value": "El Carmen", "disabled": True},
-                            {"label": "🔒🔜 Escobedo", "value": "Escobedo", "disabled": True},
-                            {"label": "🔒🔜 García", "value": "García", "disabled": True},
-                            {"label": "🔒🔜 Juárez", "value": "Juárez", "disabled": True},
-                            {"label": "🔒🔜 Allende", "value": "Allende", "disabled": True},
-                            {"label": "🔒🔜 Apodaca", "value": "Apodaca", "disabled": True},
-                            {"label": "🔒🔜 Cadereyta Jimenez", "value": "Cadereyta Jimenez", "disabled": True},
-                            {"label": "🔒🔜 Cienega de Flores", "value": "Cienega de Flores", "disabled": True},
-                            {"label": "🔒🔜 Guadalupe", "value": "Guadalupe", "disabled": True},
-                            {"label": "🔒🔜 Monterrey", "value": "Monterrey", "disabled": True},
-                            {"label": "🔒🔜 Salinas Victoria", "value": "Salinas Victoria", "disabled": True},
-                            {"label": "🔒🔜 San Nicolás de los Garza", "value": "San Nicolás de los Garza", "disabled": True},
-                            {"label": "🔒🔜 San Pedro Garza García", "value": "San Pedro Garza García", "disabled": True},
-                            {"label": "🔒🔜 Santa Catarina", "value": "Santa Catarina", "disabled": True},
-                            {"label": "🔒🔜 Santiago", "value": "Santiago", "disabled": True}
-                        ],
-                        value='Zona Metropolitana',
-                        clearable=False,
-                        style={'backgroundColor': '#FFFFFF'},
-                        className = "pt-3"
-                    )
-                ]),
-                className = "pt-4 px-3"
+            filtro(
+                "location.png", "20px", "8px", "Municipio", "municipio-tooltip-target",
+                "Aplica a los promedios, las gráficas y la descarga de datos.",
+                dcc.Dropdown(
+                    id='municipio-dropdown',
+                    options=municipio_options,
+                    value='Zona Metropolitana',
+                    clearable=False,
+                    style={'backgroundColor': '#FFFFFF'},
+                    className = "pt-3"
+                )
             ),
             # Fecha
-            dbc.Row(
-                dbc.Col([
-                    html.Div([
-                        html.Img(src="assets/calendar.png", height="18px", style={'margin-right': '10px'}),
-                        html.Span(
-                            "Fecha", style = {"font-weight": "bold"}, id="fecha-tooltip-target"
-                        ), 
-                        dbc.Tooltip(
-                            "El rango de fecha se actualiza diariamente. No se puede seleccionar un rango menor por el momento.",
-                            target="fecha-tooltip-target",
-                            placement = "top"
-                        )              
-                    ],
-                        style={'display': 'flex', 'align-items': 'center'}
-                    ),
-                    dcc.DatePickerRange(
-                        id='date-picker-range',
-                        start_date_placeholder_text="Start Period",
-                        end_date_placeholder_text="End Period",
-                        start_date=datetime(2023, 5, 8),
-                        end_date= now_mexico,
-                        min_date_allowed=datetime(2023, 5, 31),
-                        max_date_allowed=datetime(2023, 5, 8),
-                        display_format="DD/MM/YYYY",
-                        className = "pt-3 smaller-font"
-                    )
-                ]),
-                className = "pt-4 px-3"
+            filtro(
+                "calendar.png", "18px", "10px", "Fecha", "fecha-tooltip-target",
+                "El rango de fecha se actualiza diariamente y aplica a los promedios y a la descarga de datos.",
+                dcc.DatePickerRange(
+                    id='date-picker-range',
+                    start_date_placeholder_text="Start Period",
+                    end_date_placeholder_text="End Period",
+                    start_date=window_start.date(),
+                    end_date= now_local,
+                    min_date_allowed=data.START_DATE,
+                    max_date_allowed=now_local,
+                    display_format="DD/MM/YYYY",
+                    className = "pt-3 smaller-font"
+                )
             ),
             dbc.Row(
                 dbc.Col(
                     html.Hr()
                 ),
-                className = "px-3 mt-auto"
+                className = "px-3 mt-auto d-none d-xl-flex"
             ),
-            # Conoce más y descargar
+            # Conoce más y descargar (the mobile navbar has its own buttons)
             dbc.Row([
-                # Conoce más
                 dbc.Col(
-                    html.Div([
-                        dbc.Button(
-                            "Conoce más",
-                            color = "secondary",
-                            outline = True,
-                            id = "open_conocemas",
-                            n_clicks = 0,
-                            style={'border-color': '#CCCCCC', "font-size": "14px"}
-                        ),
-                        dbc.Modal([
-                            dbc.ModalHeader(
-                                dbc.ModalTitle("Conoce más")
-                            ),
-                            dbc.ModalBody([
-                                html.P([
-                                    "Desarrollamos esta plataforma para fortalecer a la ciudadanía en la lucha por crear una ciudad "
-                                    "con mejor calidad de aire para todas y todos. El sistema actual recolecta cada " 
-                                    "hora datos de los más de 100 sensores de ",
-                                    html.A("Purple Air",
-                                           href="https://www2.purpleair.com/",
-                                           target="_blank",
-                                           style={"text-decoration": "none"}),
-                                    " en el área metropolitana de Monterrey."
-                                ]),
-                                html.P([
-                                    "Si tienes dudas sobre el proyecto o te gustaría colaborar para fortalecer la plataforma "
-                                    "nos puedes enviar un correo a hola@datacomun.org o visitar nuestra página en ",
-                                    html.A(
-                                        "datacomun.org",
-                                        href="https://www.datacomun.org/",
-                                        target="_blank",
-                                        style={"text-decoration": "none"}
-                                    )
-                                ])
-                            ])
-                        ],
-                        id = "modal_conocemas",
-                        is_open = False
-                        )
-                    ]),
+                    dbc.Button(
+                        "Conoce más",
+                        color = "secondary",
+                        outline = True,
+                        id = abrir_id("conocemas", "sidebar"),
+                        n_clicks = 0,
+                        style={'border-color': '#CCCCCC', "font-size": "14px"}
+                    ),
                     className = "pb-4 pt-2 d-flex align-items-center justify-content-center"
                 ),
-                # Descargar
                 dbc.Col(
-                    html.Div([
-                        dbc.Button(
-                            html.Span("Descargar", style={"padding": "5px"}),
-                            id="open_descargar", 
-                            color="secondary",
-                            outline=True,
-                            style={'border-color': '#CCCCCC', "font-size": "14px"}
-                        ),
-                        dbc.Modal([
-                            dbc.ModalHeader(
-                                dbc.ModalTitle("Descarga los datos")
-                            ),
-                            dbc.ModalBody(
-                                html.P(
-                                    "Los datos se descargan de acuerdo a los filtros previamente seleccionados en formato CSV que puedes abrir " 
-                                    "en varias plataformas, incluyendo Excel."
-                                )
-                            ),
-                            dbc.ModalFooter([
-                                dbc.Button(
-                                    "Descargar",
-                                    id="boton_descargar", 
-                                    color="secondary",
-                                    outline=True,
-                                    style={'border-color': '#CCCCCC'}
-                                ),
-                                dcc.Download(id = "datos")
-                            ])
-                        ],
-                        id = "modal_descargar",
-                        is_open = False
-                        )
-                    ]),
+                    dbc.Button(
+                        html.Span("Descargar", style={"padding": "5px"}),
+                        id=abrir_id("descargar", "sidebar"),
+                        color="secondary",
+                        outline=True,
+                        style={'border-color': '#CCCCCC', "font-size": "14px"}
+                    ),
                     className = "pb-4 pt-2 d-flex align-items-center justify-content-center"
                 )
-            ])
+            ],
+                className = "d-none d-xl-flex"
+            )
         ],
-            className='pt-4 d-flex flex-column',
-            width=3,
-            style = {
-                "position": "fixed", 
-                "top": 0,
-                "height": "100vh",
-                "border-right": "1px solid #DBDBDB",
-                "overflow": "auto"
-            }
-        ),
+            className = "offcanvas-body d-flex flex-column pt-4"
+        )
+    ],
+        id = "sidebar",
+        className = "sidebar offcanvas-xl offcanvas-start"
+    )
 
-        # Visualizaciones
-        dbc.Col([
+    # Dims the page behind the open offcanvas; a click on it closes it.
+    backdrop = html.Div(id="sidebar-backdrop", className="sidebar-backdrop")
 
-            # Mapa
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            dcc.Graph(
-                                figure=sensors_go,
-                                config={'displaylogo': False},
-                                id="mapa-mobile"
-                            )
-                        )
-                    )
-                ),
-                className = "pt-4"
+    # Visualizaciones
+    visualizaciones = html.Div([
+        # Website's logo - Mobile
+        dbc.Row(
+            dbc.Col(
+                html.Img(src="../assets/logo_datacomun.png", height="30px"),
+                style={"color": "black"}
             ),
-            # Tabla
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            html.Div(
-                                dag.AgGrid(
-                                    id='my_ag_grid',
-                                    rowData=dataframe.to_dict('records'),
-                                    columnDefs=columnDefs,
-                                    defaultColDef={
-                                        'editable': False,
-                                        'sortable': True,
-                                        'filter': 'agTextColumnFilter',
-                                        'resizable': True
-                                    }                            
-                                )
-                            )
-                        )
-                    )
-                ),
-                className = "pt-4"
+            className = "pt-4 pb-2 d-xl-none",
+            style={"text-align": "center"}
+        ),
+        # Mapa
+        card([
+            dbc.RadioItems(
+                id="mapa-vista",
+                options=vista_options,
+                value="sensores",
+                inline=True,
+                className="pb-2"
             ),
-            # Scatter Plot
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            dcc.Graph(
-                                id='scatter_plot',
-                                figure=scatter_fig,
-                                config={'displayModeBar': False}
-                            )
-                        )            
-                    )
-                ),
-                className = "pt-4 pb-4"
+            dcc.Loading(
+                dcc.Graph(
+                    figure=placeholder_figure,
+                    config={'displaylogo': False},
+                    id="mapa"
+                )
             )
         ],
-        width=9,
-        className = "px-5",
-        style = {
-            "margin-left": "25%"
-        }
-        )
-
-    ],
-        className="m-0 d-none d-xl-block"
-    ),
-
-    # Sidebar y Visualizaciones - Mobile
-    dbc.Row(
-        dbc.Col([
-            # Webbsite's logo
-            dbc.Row(
-                dbc.Col(
-                    dbc.Row(
-                        dbc.Col(
-                            html.Img(src="../assets/logo_datacomun.png", height="30px"),
-                            style={"color": "black"}
-                        )
-                    )
-                ),
-                className = "pt-4 pb-4",
-                style={"text-align": "center"}
-            ),
-            # Mapa
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            dcc.Graph(
-                                figure=sensors_go,
-                                config={'displaylogo': False},
-                                id="mapa-mobile"
-                            )
-                        )
-                    )
-                ),
-                className = "pt-2 pb-4"
+            "pt-4"
+        ),
+        # Tabla
+        card(
+            dcc.Loading(
+                html.Div(id="tabla")
             ),
-            # Tabla
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            html.Div(
-                                dag.AgGrid(
-                                    id='my_ag_grid',
-                                    rowData=dataframe.to_dict('records'),
-                                    columnDefs=columnDefs,
-                                    defaultColDef={
-                                        'editable': False,
-                                        'sortable': True,
-                                        'filter': 'agTextColumnFilter',
-                                        'resizable': True
-                                    }                            
-                                )
-                            )
-                        )
-                    )
-                ),
-                className = "pt-2 pb-4"
+            "pt-4"
+        ),
+        # Scatter Plot
+        card(
+            dcc.Loading(
+                dcc.Graph(
+                    id='scatter_plot',
+                    figure=placeholder_figure,
+                    config={'displayModeBar': False}
+                )
             ),
-            # Scatter Plot
-            dbc.Row(
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(
-                            dcc.Graph(
-                                id='scatter_plot',
-                                figure=scatter_fig,
-                                config={'displayModeBar': False}
-                            )
-                        )            
-                    )
-                ),
-                className = "pt-2 pb-5"
+            "pt-4"
+        ),
+        # Lecturas
+        card(
+            dcc.Loading(
+                html.Div(id="lecturas")
             ),
-            # NavBar
-            dbc.Row([
-                # Filtros
-                dbc.Col(
-                    html.Div([
-                        html.Button(
-                            html.Img(src="assets/filtro.png", height="26px"), 
-                            id="open_offcanvas",
-                            n_clicks=0,
-                            style={
-                                "background": "none",
-                                "border": "none",
-                                "cursor": "pointer",
-                            }
-                        ),
-                        dbc.Offcanvas([
-                            # Fuente de datos
-                            dbc.Row(
-                                dbc.Col([
-                                    html.Div([
-                                        html.Img(src="assets/sensor.png", height="22px", style={'margin-right': '6px'}),
-                                        html.Span(
-                                            "Fuente de Datos", style = {"font-weight": "bold"}, id="fuente-tooltip-target"
-                                        ), 
-                                        dbc.Tooltip(
-                                            "Solo una fuente de datos disponible por el momento.",
-                                            target="fuente-tooltip-target",
-                                            placement = "top"
-                                        )              
-                                    ],
-                                        style={'display': 'flex', 'align-items': 'center'}
-                                    ),
-                                    dcc.Dropdown(
-                                        id='municipio-dropdown-d',
-                                        options=[
-                                            {"label": "Sensores de Purple Air", "value": "Sensores de Purple Air"},
-                                            {"label": "🔒🔜 Sensores del Estado de N.L.", "value": "Sensores del Estado de Nuevo León",
-                                            "disabled": True}
-                                        ],
-                                        value='Sensores de Purple Air',
-                                        clearable=False,
-                                        style={'backgroundColor': '#FFFFFF'},
-                                        className = "pt-3"
-                                    )
-                                ]),
-                                className = "pt-4 px-3"
-                            ),
-                            # Indicador
-                            dbc.Row(
-                                dbc.Col([
-                                    html.Div([
-                                        html.Img(src="assets/indicador.png", height="20px", style={'margin-right': '8px'}),
-                                        html.Span(
-                                            "Indicador", style = {"font-weight": "bold"}, id="indicador-tooltip-target"
-                                        ), 
-                                        dbc.Tooltip(
-                                            "Solo un indicador disponible por el momento.",
-                                            target="indicador-tooltip-target",
-                                            placement = "top"
-                                        )              
-                                    ],
-                                        style={'display': 'flex', 'align-items': 'center'}
-                                    ),
-                                    dcc.Dropdown(
-                                        id='mes-dropdown-d',
-                                        options=[
-                                            {"label": "PM2.5", "value": "PM2.5"},
-                                            {"label": "🔒🔜 PM10.0", "value": "PM10.0", "disabled": True},
-                                            {"label": "🔒🔜 Temperatura", "value": "Temperatura", "disabled": True}
-                                        ],
-                                        value='PM2.5',
-                                        clearable=False,
-                                        style={'backgroundColor': '#FFFFFF'},
-                                        className = "pt-3"
-                                    )
-                                ]),
-                                className = "pt-4 px-3"
-                            ),
-                            # Municipio
-                            dbc.Row(
-                                dbc.Col([
-                                    html.Div([
-                                        html.Img(src="assets/location.png", height="20px", style={'margin-right': '8px'}),
-                                        html.Span(
-                                            "Municipio", style = {"font-weight": "bold"}, id="municipio-tooltip-target"
-                                        ), 
-                                        dbc.Tooltip(
-                                            "Solo una opción disponible por el momento.",
-                                            target="municipio-tooltip-target",
-                                            placement = "top"
-                                        )              
-                                    ],
-                                        style={'display': 'flex', 'align-items': 'center'}
-                                    ),
-                                    dcc.Dropdown(
-                                        id='mes-dropdown-m',
-                                        options=[
-                                            {"label": "Zona Metropolitana", "value": "Zona Metropolitana"},
-                                            {"label": "🔒🔜 Abasolo", "value": "Abasolo", "disabled": True},
-                                            {"label": "🔒🔜 El Carmen", "value": "El Carmen", "disabled": True},
-                                            {"label": "🔒🔜 Escobedo", "value": "Escobedo", "disabled": True},
-                                            {"label": "🔒🔜 García", "value": "García", "disabled": True},
-                                            {"label": "🔒🔜 Juárez", "value": "Juárez", "disabled": True},
-                                            {"label": "🔒🔜 Allende", "value": "Allende", "disabled": True},
-                                            {"label": "🔒🔜 Apodaca", "value": "Apodaca", "disabled": True},
-                                            {"label": "🔒🔜 Cadereyta Jimenez", "value": "Cadereyta Jimenez", "disabled": True},
-                                            {"label": "🔒🔜 Cienega de Flores", "value": "Cienega de Flores", "disabled": True},
-                                            {"label": "🔒🔜 Guadalupe", "value": "Guadalupe", "disabled": True},
-                                            {"label": "🔒🔜 Monterrey", "value": "Monterrey", "disabled": True},
-                                            {"label": "🔒🔜 Salinas Victoria", "value": "Salinas Victoria", "disabled": True},
-                                            {"label": "🔒🔜 San Nicolás de los Garza", "value": "San Nicolás de los Garza", "disabled": True},
-                                            {"label": "🔒🔜 San Pedro Garza García", "value": "San Pedro Garza García", "disabled": True},
-                                            {"label": "🔒🔜 Santa Catarina", "value": "Santa Catarina", "disabled": True},
-                                            {"label": "🔒🔜 Santiago", "value": "Santiago", "disabled": True}
-                                        ],
-                                        value='Zona Metropolitana',
-                                        clearable=False,
-                                        style={'backgroundColor': '#FFFFFF'},
-                                        className = "pt-3"
-                                    )
-                                ]),
-                                className = "pt-4 px-3"
-                            ),
-                            # Fecha
-                            dbc.Row(
-                                dbc.Col([
-                                    html.Div([
-                                        html.Img(src="assets/calendar.png", height="18px", style={'margin-right': '10px'}),
-                                        html.Span(
-                                            "Fecha", style = {"font-weight": "bold"}, id="fecha-tooltip-target"
-                                        ), 
-                                        dbc.Tooltip(
-                                            "El rango de fecha se actualiza diariamente. No se puede seleccionar un rango menor por el momento.",
-                                            target="fecha-tooltip-target",
-                                            placement = "top"
-                                        )              
-                                    ],
-                                        style={'display': 'flex', 'align-items': 'center'}
-                                    ),
-                                    dcc.DatePickerRange(
-                                        id='date-picker-range',
-                                        start_date_placeholder_text="Start Period",
-                                        end_date_placeholder_text="End Period",
-                                        start_date=datetime(2023, 5, 8),
-                                        end_date= now_mexico,
-                                        min_date_allowed=datetime(2023, 5, 31),
-                                        max_date_allowed=datetime(2023, 5, 8),
-                                        display_format="DD/MM/YYYY",
-                                        className = "smaller-font pt-3"
-                                    )
-                                ]),
-                                className = "pt-4 px-3"
-                            )
-                        ],
-                            id = "offcanvas",
-                            is_open = False,
-                            placement = "start",
-                            style = {"z-index": "9998"}
-                        )
-                    ]),
-                    className = "d-flex align-items-center justify-content-center"
-                ),
-                # Conoce más
-                dbc.Col(
-                    html.Div([
-                        html.Button(
-                            html.Img(src="assets/info.png", height="30px"), 
-                            id="open_conocemas_m",
-                            n_clicks=0,
-                            style={
-                                "background": "none",
-                                "border": "none",
-                                "cursor": "pointer",
-                            }
-                        ),
-                        dbc.Modal([
-                            dbc.ModalHeader(
-                                dbc.ModalTitle("Conoce más")
-                            ),  
-                            dbc.ModalBody([
-                                html.P([
-                                    "Desarrollamos esta plataforma para fortalecer a la ciudadanía en la lucha por crear una ciudad "
-                                    "con mejor calidad de aire para todas y todos. El sistema actual recolecta cada " 
-                                    "hora datos de los más de 100 sensores de ",
-                                    html.A("Purple Air",
-                                           href="https://www2.purpleair.com/",
-                                           target="_blank",
-                                           style={"text-decoration": "none"}),
-                                    " en el área metropolitana de Monterrey."
-                                ]),
-                                html.P([
-                                    "Si tienes dudas sobre el proyecto o te gustaría colaborar para fortalecer la plataforma "
-                                    "nos puedes enviar un correo a hola@datacomun.org o visitar nuestra página en ",
-                                    html.A(
-                                        "datacomun.org",
-                                        href="https://www.datacomun.org/",
-                                        target="_blank",
-                                        style={"text-decoration": "none"}
-                                    )
-                                ])
-                            ])
-                        ],
-                        id = "modal_conocemas_m",
-                        is_open = False
-                        )
-                    ]),
-                    className = "d-flex align-items-center justify-content-center"
-                ),
-                # Descargar datos
-                dbc.Col(
-                    html.Div([
-                        html.Button(
-                            html.Img(src="assets/download.png", height="26px"), 
-                            id="open_descargar_m",
-                            n_clicks=0,
-                            style={
-                                "background": "none",
-                                "border": "none",
-                                "cursor": "pointer",
-                            }
-                        ),
-                        dbc.Modal([
-                            dbc.ModalHeader(
-                                dbc.ModalTitle("Descarga los datos")
-                            ),
-                            dbc.ModalBody(
-                                html.P(
-                                    "Los datos se descargan de acuerdo a los filtros previamente seleccionados en formato CSV que puedes abrir " 
-                                    "en varias plataformas, incluyendo Excel."
-                                )
-                            ),
-                            dbc.ModalFooter([
-                                dbc.Button(
-                                    "Descargar",
-                                    id="boton_descargar_m", 
-                                    color="secondary",
-                                    outline=True,
-                                    style={'border-color': '#CCCCCC'}
-                                ),
-                                dcc.Download(id = "datos_m")
-                            ])
-                        ],
-                        id = "modal_descargar_m",
-                        is_open = False
-                        )
-                    ]),
-                    className = "d-flex align-items-center justify-content-center"
-                )
-            ],  
-                className = "pb-2 pt-2 position-fixed w-100",
-                style = {"bottom": "0", "background-color": "black", "z-index": "9997"}
-            )
-        ]),
-        className = "m-0 d-xl-none"
+            "pt-4 pb-4"
+        )
+    ],
+        className = "visualizaciones"
     )
 
-])
+    # NavBar - Mobile
+    navbar = dbc.Row([
+        navbar_button("filtro.png", "26px", "open_offcanvas"),
+        navbar_button("info.png", "30px", abrir_id("conocemas", "navbar")),
+        navbar_button("download.png", "26px", abrir_id("descargar", "navbar"))
+    ],  
+        className = "pb-2 pt-2 position-fixed w-100 m-0 d-xl-none",
+        style = {"bottom": "0", "background-color": "black", "z-index": "9997"}
+    )
 
+    return html.Div([
+        sidebar,
+        backdrop,
+        visualizaciones,
+        navbar,
+        modal_conocemas(),
+        modal_descargar()
+    ])
@@ -0,0 +1,72 @@
+"""The ingestion buffer's segments, replay order and checkpoints, in a temp directory."""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from aire.ingest.buffer import Buffer, encode
+from aire.ingest.purpleair import Reading
+
+START = datetime(2024, 1, 1)
+
+
+def readings(first, count):
+    return [Reading(sensor_id, 10.0, 50.0, 25.0, START + timedelta(minutes=sensor_id))
+            for sensor_id in range(first, first + count)]
+
+
+def replay_ids(buffer, fail_after=None):
+    """Replay into a list of batches of sensor_ids; raise after fail_after batches."""
+    batches = []
+
+    def write(batch):
+        if fail_after is not None and len(batches) >= fail_after:
+            raise RuntimeError("database down")
+        batches.append([reading.sensor_id for reading in batch])
+
+    return buffer.replay(write), batches
+
+
+def test_replay_delivers_oldest_first_in_bounded_batches(tmp_path):
+    buffer = Buffer(str(tmp_path), batch_rows=4)
+    buffer.append(readings(1, 6))
+    buffer.append(readings(7, 5))
+    delivered, batches = replay_ids(buffer)
+    assert delivered == 11
+    assert [sensor_id for batch in batches for sensor_id in batch] == list(range(1, 12))
+    assert max(len(batch) for batch in batches) <= 4
+
+
+def test_segments_roll_over_at_the_byte_bound(tmp_path):
+    line = len(encode(readings(1, 1)[0]))
+    buffer = Buffer(str(tmp_path), segment_bytes=3 * line)
+    for first in range(1, 10, 3):
+        buffer.append(readings(first, 3))
+    segments = buffer.segments()
+    assert len(segments) == 3
+    assert all(os.path.getsize(segment) <= 3 * line for segment in segments)
+    assert buffer.pending_bytes() == 9 * line
+    delivered, batches = replay_ids(buffer)
+    assert [sensor_id for batch in batches for sensor_id in batch] == list(range(1, 10))
+
+
+def test_failed_write_resumes_after_the_last_checkpoint(tmp_path):
+    buffer = Buffer(str(tmp_path), batch_rows=2)
+    buffer.append(readings(1, 5))
+    with pytest.raises(RuntimeError):
+        replay_ids(buffer, fail_after=1)
+    # The delivered batch is checkpointed; the rest is still pending.
+    assert buffer.segments()
+    delivered, batches = replay_ids(buffer)
+    assert delivered == 3
+    assert batches == [[3, 4], [5]]
+
+
+def test_delivered_segments_are_deleted(tmp_path):
+    buffer = Buffer(str(tmp_path))
+    buffer.append(readings(1, 3))
+    replay_ids(buffer)
+    assert buffer.segments() == []
+    assert buffer.pending_bytes() == 0
+    assert sorted(os.listdir(tmp_path)) == ['buffer.lock']
+    assert replay_ids(buffer) == (0, [])
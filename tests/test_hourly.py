@@ -0,0 +1,46 @@
+"""HourlyStore appends into shared, growing buffers without disturbing older stores."""
+import numpy as np
+import pandas as pd
+
+from aire import data
+
+SENSORS = pd.DataFrame({'sensor_id': [1, 2, 3], 'nombre': ['a', 'b', 'c'], 'municipio': ['x', 'x', 'y']})
+
+
+def readings(hours, first_id=1):
+    fechas = pd.Timestamp('2024-01-01') + pd.to_timedelta(hours, unit='h')
+    return pd.DataFrame({
+        'pollution_id': np.arange(first_id, first_id + len(hours)),
+        'fecha': fechas,
+        'sensor_id': [1 + hour % 3 for hour in hours],
+        'pm25': [float(hour) for hour in hours],
+        'humidity': 50.0,
+        'temp_celsius': 20.0,
+    }).astype(data.READING_DTYPES)
+
+
+def test_totals_match_a_single_append():
+    batches = [list(range(0, 10)), list(range(10, 20)), [3, 4, 25]]
+    store = data.HourlyStore()
+    for batch in batches:
+        store = store.append(readings(batch), SENSORS)
+    whole = data.HourlyStore().append(readings([hour for batch in batches for hour in batch]), SENSORS)
+    assert (np.diff(store.buckets) >= np.timedelta64(0)).all()
+    pd.testing.assert_frame_equal(store.totals().sort_values('sensor_id').reset_index(drop=True),
+                                  whole.totals().sort_values('sensor_id').reset_index(drop=True))
+
+
+def test_older_stores_keep_their_rows():
+    base = data.HourlyStore().append(readings([0, 1, 2]), SENSORS)
+    first = base.append(readings([3, 4]), SENSORS)
+    # Appending to base again must not overwrite first's rows.
+    second = base.append(readings([5]), SENSORS)
+    assert len(base) == 3 and len(first) == 5 and len(second) == 4
+    assert first.totals()['sum_pm25'].sum() == sum(range(5))
+    assert second.totals()['sum_pm25'].sum() == 0 + 1 + 2 + 5
+
+
+def test_appends_reuse_the_buffers_until_full():
+    store = data.HourlyStore().append(readings([0]), SENSORS)
+    grown = store.append(readings([1]), SENSORS)
+    assert np.shares_memory(store.buckets, grown.buckets)
@@ -0,0 +1,89 @@
+"""The PurpleAir client against aire.ingest.fake, served on a local port."""
+import asyncio
+import contextlib
+
+import aiohttp
+from aiohttp import web
+
+from aire.ingest import purpleair
+from aire.ingest.fake import FakePurpleAir
+
+
+class FailingGroups(FakePurpleAir):
+    """Answers every group request with a 503; single sensors still work."""
+
+    async def group(self, request):
+        self.served += 1
+        return web.json_response({'error': 'InternalError'}, status=503)
+
+
+@contextlib.asynccontextmanager
+async def client(fake, **kwargs):
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            yield purpleair.PurpleAir(session, base_url=f"http://127.0.0.1:{port}/v1", backoff=0.01, **kwargs)
+    finally:
+        await runner.cleanup()
+
+
+def run(fake, sensor_ids, batch_size=purpleair.PURPLEAIR_BATCH_SIZE, each=False, **kwargs):
+    async def main():
+        async with client(fake, **kwargs) as purple:
+            if each:
+                readings, failed = await purple.each(sensor_ids)
+            else:
+                readings, failed = await purple.sensors(sensor_ids, batch_size)
+            return readings, failed, purple.requests
+
+    return asyncio.run(main())
+
+
+def test_group_request_fetches_every_sensor():
+    sensor_ids = list(range(1, 101))
+    readings, failed, requests = run(FakePurpleAir(latency=0), sensor_ids)
+    assert sorted(reading.sensor_id for reading in readings) == sensor_ids
+    assert failed == []
+    assert requests == 1
+
+
+def test_groups_are_split_by_batch_size():
+    readings, failed, requests = run(FakePurpleAir(latency=0), list(range(1, 11)), batch_size=4)
+    assert len(readings) == 10
+    assert requests == 3
+
+
+def test_failed_group_falls_back_to_single_sensors():
+    sensor_ids = list(range(1, 6))
+    readings, failed, requests = run(FailingGroups(latency=0), sensor_ids, retries=0)
+    assert sorted(reading.sensor_id for reading in readings) == sensor_ids
+    assert failed == []
+    assert requests == 1 + len(sensor_ids)
+
+
+def test_sensors_missing_from_the_answer_are_skipped():
+    # Missing means not seen within max_age; asking one by one won't help.
+    readings, failed, requests = run(FakePurpleAir(latency=0, missing_rate=1.0), list(range(1, 21)))
+    assert readings == []
+    assert failed == []
+    assert requests == 1
+
+
+def test_rate_limit_is_waited_out_without_failing():
+    fake = FakePurpleAir(latency=0, rate_limit=5)
+    sensor_ids = list(range(1, 13))
+    readings, failed, requests = run(fake, sensor_ids, each=True, retries=0)
+    assert sorted(reading.sensor_id for reading in readings) == sensor_ids
+    assert failed == []
+    assert requests > len(sensor_ids)
+
+
+def test_rate_limit_retries_are_bounded():
+    fake = FakePurpleAir(latency=0, rate_limit=1)
+    readings, failed, requests = run(fake, list(range(1, 4)), each=True, rate_limit_retries=0)
+    assert failed
+    assert len(readings) + len(failed) == 3
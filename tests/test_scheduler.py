@@ -0,0 +1,62 @@
+"""The ingestion scheduler's ticks, driven by a fake clock instead of sleeping."""
+from aire.ingest.scheduler import Scheduler
+
+
+class FakeClock:
+    """Time that only moves when the scheduler waits or a job runs."""
+
+    def __init__(self, now):
+        self.now = now
+        self.stopped = False
+
+    def __call__(self):
+        return self.now
+
+    # Stands in for the scheduler's stop Event.
+    def is_set(self):
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+    def wait(self, seconds):
+        self.now += seconds
+
+
+def run(start, durations, **kwargs):
+    """Run until every duration is used; return the ticks the job ran for."""
+    clock = FakeClock(start)
+    scheduler = Scheduler(None, clock=clock, metrics_file=None, **kwargs)
+    scheduler._stop = clock
+    ticks = []
+
+    def job(tick):
+        ticks.append(tick.timestamp())
+        clock.now += durations[len(ticks) - 1]
+        if len(ticks) == len(durations):
+            scheduler.stop()
+
+    scheduler.job = job
+    scheduler.run()
+    return ticks, scheduler
+
+
+def test_ticks_are_aligned_to_the_interval_plus_offset():
+    ticks, scheduler = run(1000.5, [5, 5, 5], interval=300, offset=10)
+    assert ticks == [1210, 1510, 1810]
+    assert scheduler.overruns == 0
+    assert scheduler.max_lag == 0
+
+
+def test_overrun_skips_missed_ticks_and_runs_the_latest():
+    # The first cycle ends at 260, past the ticks at 120, 180 and 240.
+    ticks, scheduler = run(0, [200, 1, 1], interval=60, offset=0, catch_up=1)
+    assert ticks == [60, 240, 300]
+    assert scheduler.overruns == 1
+    assert scheduler.missed_ticks == 3
+
+
+def test_no_catch_up_waits_for_the_next_tick():
+    ticks, scheduler = run(0, [200, 1], interval=60, offset=0, catch_up=0)
+    assert ticks == [60, 300]
+    assert scheduler.missed_ticks == 3